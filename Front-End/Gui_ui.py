@@ -3,8 +3,13 @@ from PyQt5.QtWidgets import QWidget, QAbstractItemView
 from PyQt5.QtGui import QCursor
 from PyQt5.QtCore import Qt
 from sqLiteManagerGUI import sqLiteDB
+from prefixIndex import CodeCompleter
+from statsPanel import StatsPanel
+from legRenderer import LegRenderer
+from storageBackend import MemoryBackend
+from boardPanel import BoardPanel
 from copy import copy as copy
-import os,time
+import os,sys,time,sqlite3
 
 
 def waiting_effects(function):
@@ -194,11 +199,20 @@ class Ui_FlightScheduler(QWidget):
         self.fullRandom_btn = QtWidgets.QPushButton(FlightScheduler)
         self.fullRandom_btn.setObjectName("fullRandom_btn")
         self.horizontalLayout_3.addWidget(self.fullRandom_btn)
+        self.rotation_btn = QtWidgets.QPushButton(FlightScheduler)
+        self.rotation_btn.setObjectName("rotation_btn")
+        self.horizontalLayout_3.addWidget(self.rotation_btn)
         #self.rndRoute_btn = QtWidgets.QPushButton(FlightScheduler)
         #self.rndRoute_btn.setObjectName("rndRoute_btn")
         self.updateTable_btn = QtWidgets.QPushButton(FlightScheduler)
         #self.horizontalLayout_3.addWidget(self.rndRoute_btn)
         self.horizontalLayout_3.addWidget(self.updateTable_btn)
+        self.stats_btn = QtWidgets.QPushButton(FlightScheduler)
+        self.stats_btn.setObjectName("stats_btn")
+        self.horizontalLayout_3.addWidget(self.stats_btn)
+        self.board_btn = QtWidgets.QPushButton(FlightScheduler)
+        self.board_btn.setObjectName("board_btn")
+        self.horizontalLayout_3.addWidget(self.board_btn)
         self.rightPanel.addLayout(self.horizontalLayout_3)
         self.horizontalLayout.addLayout(self.rightPanel)
 
@@ -236,17 +250,51 @@ class Ui_FlightScheduler(QWidget):
         #item = self.displayTable.horizontalHeaderItem(4)
         #item.setText(_translate("FlightScheduler", "Via"))
         self.fullRandom_btn.setText(_translate("FlightScheduler", "Random Flight"))
+        self.rotation_btn.setText(_translate("FlightScheduler", "Random Rotation"))
         #self.rndRoute_btn.setText(_translate("FlightScheduler", "Random Route"))
         self.updateTable_btn.setText(_translate("FlightScheduler", "Refresh Table"))
+        self.stats_btn.setText(_translate("FlightScheduler", "Statistics"))
+        self.board_btn.setText(_translate("FlightScheduler", "Departures"))
 
     def __init__(self):
         QWidget.__init__(self)
         self.setupUi(self)
         self.reset = False
+        self.liveUpdates = False
+        self.sortColumn = 0
+        self.sortDescending = False
+        self.pageSize = 200
+        self.lastTableRow = None
+        self.tableExhausted = True
         #read in aircraftFamilies mapped to subtypes
-        self.fileName = os.getcwd()+"\\FlightDB.db"
-        self.db = sqLiteDB(self.fileName)
+        if getattr(sys,"frozen",False):
+            ####frozen builds ship FlightDB.db next to the executable
+            self.fileName = os.path.join(os.path.dirname(sys.executable),"FlightDB.db")
+        else:
+            self.fileName = os.path.join(os.getcwd(),"FlightDB.db")
+        if "--in-memory" in sys.argv:
+            ####whole DB copied into RAM at startup, worth it on hosts with memory to spare
+            self.db = sqLiteDB(self.fileName,readOnly=True,backend=MemoryBackend(self.fileName))
+        else:
+            self.db = sqLiteDB(self.fileName,readOnly=True)
+        snapshotPath = os.path.splitext(self.fileName)[0]+".snapshot"
+        if os.path.isfile(os.path.join(snapshotPath,"meta.json")):
+            try:
+                if self.db.loadSnapshot(snapshotPath):
+                    self.db.enableIncremental()
+                    ####filters are re-evaluated incrementally so the table follows every click
+                    self.liveUpdates = True
+                    self.updateTable_btn.setVisible(False)
+                else:
+                    print("snapshot does not match FlightDB.db, rebuild it with prepareDatabase.py")
+            except ImportError:
+                print("numpy not installed, snapshot ignored")
         self.acSchema = self.db.pullAircraft()
+        self.codes = CodeCompleter(self.db)
+        self.renderer = LegRenderer(self.db)
+        self.setupCompleter(self.airlineText,self.codes.suggestAirlines)
+        self.setupCompleter(self.departureText,self.codes.suggestAirports)
+        self.setupCompleter(self.arrivalText,self.codes.suggestAirports)
         ####initialize master vectors#####
         self.master_familyVector = {}
         self.master_subtypeVector = {}
@@ -272,9 +320,20 @@ class Ui_FlightScheduler(QWidget):
         self.longDuration_btn.toggled.connect(self.setLongDuration)
         self.ultraLongDuration_btn.toggled.connect(self.setUltraDuration)
         self.fullRandom_btn.pressed.connect(self.generateFlight)
+        self.rotation_btn.pressed.connect(self.generateRotation)
+        ####rotations need buildRotationTable to have been run on the DB
+        self.rotation_btn.setEnabled(self.db.hasTable("Rotation"))
         #self.rndRoute_btn.pressed.connect(self.generateRoute)
         self.updateTable_btn.pressed.connect(self.updateTable)
+        self.statsPanel = None
+        self.stats_btn.pressed.connect(self.showStatistics)
+        self.boardPanel = None
+        self.board_btn.pressed.connect(self.showDepartures)
         self.displayTable.setRowCount(0)
+        self.displayTable.horizontalHeader().setSortIndicatorShown(True)
+        self.displayTable.horizontalHeader().setSortIndicator(0,QtCore.Qt.AscendingOrder)
+        self.displayTable.horizontalHeader().sectionClicked.connect(self.sortTable)
+        self.displayTable.verticalScrollBar().valueChanged.connect(self.tableScrolled)
         self.displayTable.itemClicked.connect(self.generateFlightFromTable)
         self.outputLegList.itemClicked.connect(self.displayLeg)
         self.currentCheckBox.stateChanged.connect(self.currentCheckChanged)
@@ -285,6 +344,74 @@ class Ui_FlightScheduler(QWidget):
         self.era1990CheckBox.stateChanged.connect(self.erasCheckChanged)
         self.era2000CheckBox.stateChanged.connect(self.erasCheckChanged)
         self.eraModernCheckBox.stateChanged.connect(self.erasCheckChanged)
+        self.airlineText.editingFinished.connect(self.liveRefresh)
+        self.departureText.editingFinished.connect(self.liveRefresh)
+        self.arrivalText.editingFinished.connect(self.liveRefresh)
+        self.currentTimeEntry.editingFinished.connect(self.liveRefresh)
+        self.liveRefresh()
+
+    def setupCompleter(self,lineEdit,suggest):
+        completer = QtWidgets.QCompleter(self)
+        completer.setModel(QtCore.QStringListModel(completer))
+        completer.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        completer.setWidget(lineEdit)
+        lineEdit.textEdited.connect(lambda text: self.updateSuggestions(completer,suggest,text))
+        completer.activated[str].connect(lambda choice: self.acceptSuggestion(lineEdit,choice))
+
+    def updateSuggestions(self,completer,suggest,text):
+        ####only the code currently being typed is completed
+        suggestions = suggest(text.split(',')[-1])
+        completer.model().setStringList(suggestions)
+        if len(suggestions) > 0:
+            completer.complete()
+        else:
+            completer.popup().hide()
+
+    def acceptSuggestion(self,lineEdit,choice):
+        codes = lineEdit.text().split(',')[:-1]
+        codes.append(choice.split(" - ")[0])
+        lineEdit.setText(",".join([code.strip(' ') for code in codes]))
+
+    def readTextFilters(self):
+        if self.currentCheckBox.isChecked():
+            timeFromNow = self.sanitizeInput(self.currentTimeEntry.text())[0]
+            try:
+                timeFromNow = int(timeFromNow)
+                self.db.timeFromNow = timeFromNow
+            except:
+                print("User entered non-number")
+                self.db.timeFromNow = -1
+        if self.airlineCheck.isChecked():
+            self.db.desiredAirline = self.sanitizeInput(self.airlineText.text())
+        if self.airportCheck.isChecked():
+            self.db.desiredOrigin = self.sanitizeInput(self.departureText.text())
+            self.db.desiredDest = self.sanitizeInput(self.arrivalText.text())
+        return self.checkCodes()
+
+    def checkCodes(self):
+        unknown = []
+        if self.airlineCheck.isChecked():
+            unknown += self.codes.unknownAirlines(self.db.desiredAirline)
+        if self.airportCheck.isChecked():
+            unknown += self.codes.unknownAirports(self.db.desiredOrigin+self.db.desiredDest)
+        if len(unknown) > 0:
+            self.outputText.setText("Unknown code(s): "+", ".join(unknown))
+            return False
+        return True
+
+    def liveRefresh(self):
+        if self.liveUpdates:
+            self.db.checkSnapshot()
+            self.checkLiveUpdates()
+        if self.liveUpdates and not self.reset:
+            self.updateTable()
+
+    def checkLiveUpdates(self):
+        ####without the snapshot every click would run the route query on this thread
+        if self.liveUpdates and self.db.snapshotDropped:
+            self.liveUpdates = False
+            self.updateTable_btn.setVisible(True)
+            self.outputText.setText("The schedule changed, live table updates are off, use Refresh Table")
 
     def currentCheckChanged(self):
         if not self.currentCheckBox.isChecked():
@@ -293,6 +420,7 @@ class Ui_FlightScheduler(QWidget):
         else:
 
             self.currentTimeEntry.setEnabled(True)
+        self.liveRefresh()
 
     def erasCheckChanged(self):
         eraList = [1,1,1,1,1,1,1]
@@ -311,40 +439,79 @@ class Ui_FlightScheduler(QWidget):
         if not self.eraModernCheckBox.isChecked():
             eraList[6] = 0
         self.db.desiredEras = eraList
+        self.liveRefresh()
 
 #    @waiting_effects
     def updateTable(self):
-        if self.currentCheckBox.isChecked():
-            timeFromNow = self.sanitizeInput(self.currentTimeEntry.text())[0]
-            try:
-                timeFromNow = int(timeFromNow)
-                self.db.timeFromNow = timeFromNow
-            except:
-                print("User entered non-number")
-                self.db.timeFromNow = -1
-        if self.airlineCheck.isChecked():
-            self.db.desiredAirline = self.sanitizeInput(self.airlineText.text())
-        if self.airportCheck.isChecked():
-            self.db.desiredOrigin = self.sanitizeInput(self.departureText.text())
-            self.db.desiredDest = self.sanitizeInput(self.arrivalText.text())
-        tableData = self.db.getTableDetails()
-        if len(tableData) > 0 and not tableData == "NONE":
-            self.displayTable.setRowCount(len(tableData))
-            for i in range(0,len(tableData)):
-                item0 = QTableWidgetItem(tableData[i][0])
-                item0.setFlags(QtCore.Qt.ItemIsEnabled)
-                self.displayTable.setItem(i,0,item0)
-                item1 = QTableWidgetItem(tableData[i][1])
-                item1.setFlags(QtCore.Qt.ItemIsEnabled)
-                self.displayTable.setItem(i,1,item1)
-                item2 = QTableWidgetItem(tableData[i][2])
-                item2.setFlags(QtCore.Qt.ItemIsEnabled)
-                self.displayTable.setItem(i,2,item2)
-                item3 = QTableWidgetItem(tableData[i][3])
-                item3.setFlags(QtCore.Qt.ItemIsEnabled)
-                self.displayTable.setItem(i,3,item3)
+        if not self.readTextFilters():
+            return
+        self.displayTable.setRowCount(0)
+        self.lastTableRow = None
+        self.tableExhausted = False
+        self.loadTablePage()
+        if self.db.truncated:
+            self.outputText.setText("Too many routes, only the first "+str(self.db.maxRows)+" are listed")
+        self.checkLiveUpdates()
+
+    def runQuery(self,query,*args):
+        try:
+            return query(*args)
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                self.outputText.setText("Query took longer than "+str(self.db.queryTimeout)+"s, try narrowing the filters")
+            else:
+                self.outputText.setText("Query failed: "+str(e))
+            return None
+
+    def loadTablePage(self):
+        if self.tableExhausted:
+            return
+        tableData = self.runQuery(self.db.getTablePage,self.sortColumn,self.sortDescending,self.lastTableRow,self.pageSize)
+        if tableData == None:
+            self.tableExhausted = True
+            return
+        if len(tableData) < self.pageSize:
+            self.tableExhausted = True
+        if len(tableData) == 0:
+            return
+        self.lastTableRow = tableData[-1]
+        first = self.displayTable.rowCount()
+        self.displayTable.setRowCount(first+len(tableData))
+        for i in range(0,len(tableData)):
+            item0 = QTableWidgetItem(tableData[i][0])
+            item0.setFlags(QtCore.Qt.ItemIsEnabled)
+            self.displayTable.setItem(first+i,0,item0)
+            item1 = QTableWidgetItem(tableData[i][1])
+            item1.setFlags(QtCore.Qt.ItemIsEnabled)
+            self.displayTable.setItem(first+i,1,item1)
+            item2 = QTableWidgetItem(tableData[i][2])
+            item2.setFlags(QtCore.Qt.ItemIsEnabled)
+            self.displayTable.setItem(first+i,2,item2)
+            item3 = QTableWidgetItem(tableData[i][3])
+            item3.setFlags(QtCore.Qt.ItemIsEnabled)
+            self.displayTable.setItem(first+i,3,item3)
+
+    def tableScrolled(self,value):
+        if value >= self.displayTable.verticalScrollBar().maximum()-5:
+            self.loadTablePage()
+
+    def sortTable(self,column):
+        if column > 3:
+            return
+        if column == self.sortColumn:
+            self.sortDescending = not self.sortDescending
         else:
-            self.displayTable.setRowCount(0)
+            self.sortColumn = column
+            self.sortDescending = False
+        if self.sortDescending:
+            self.displayTable.horizontalHeader().setSortIndicator(column,QtCore.Qt.DescendingOrder)
+        else:
+            self.displayTable.horizontalHeader().setSortIndicator(column,QtCore.Qt.AscendingOrder)
+        ####re-sorting reuses the cached result, only the first page is rendered
+        self.displayTable.setRowCount(0)
+        self.lastTableRow = None
+        self.tableExhausted = False
+        self.loadTablePage()
 
 #    @waiting_effects
     def generateFlightFromTable(self):
@@ -354,43 +521,53 @@ class Ui_FlightScheduler(QWidget):
         origin = self.displayTable.item(row,1).text()
         dest = self.displayTable.item(row,2).text()
         aircraft = self.displayTable.item(row,3).text()
-        result = self.db.getSpecificFlight(airline,origin,dest,aircraft)
+        result = self.runQuery(self.db.getSpecificFlight,airline,origin,dest,aircraft)
+        if result == None:
+            return
         self.displayOutput(result)
 
     def generateFlight(self):
         self.outputText.setText("Thinking....")
-        if self.currentCheckBox.isChecked():
-            timeFromNow = self.sanitizeInput(self.currentTimeEntry.text())[0]
-            try:
-                timeFromNow = int(timeFromNow)
-                self.db.timeFromNow = timeFromNow
-            except:
-                print("User entered non-number")
-                self.db.timeFromNow = -1
-        if self.airlineCheck.isChecked():
-            self.db.desiredAirline = self.sanitizeInput(self.airlineText.text())
-        if self.airportCheck.isChecked():
-            self.db.desiredOrigin = self.sanitizeInput(self.departureText.text())
-            self.db.desiredDest = self.sanitizeInput(self.arrivalText.text())
-        result = self.db.getRandomFlight()
+        if not self.readTextFilters():
+            return
+        result = self.runQuery(self.db.getRandomFlight)
+        if result == None:
+            return
+        self.displayOutput(result)
+
+    def showStatistics(self):
+        if not self.readTextFilters():
+            return
+        if self.statsPanel == None:
+            self.statsPanel = StatsPanel(self)
+        self.statsPanel.show()
+        self.statsPanel.refresh(self.db)
+
+    def showDepartures(self):
+        ####filters are read when the board opens, press again to pick up changes
+        if not self.readTextFilters():
+            return
+        if self.boardPanel == None:
+            self.boardPanel = BoardPanel(self)
+        self.runQuery(self.boardPanel.load,self.db)
+        self.boardPanel.show()
+
+    def generateRotation(self):
+        self.outputText.setText("Thinking....")
+        if not self.readTextFilters():
+            return
+        result = self.runQuery(self.db.getRandomRotation)
+        if result == None:
+            return
         self.displayOutput(result)
 
     def generateRoute(self):
         self.outputText.setText("Thinking....")
-        if self.currentCheckBox.isChecked():
-            timeFromNow = self.sanitizeInput(self.currentTimeEntry.text())[0]
-            try:
-                timeFromNow = int(timeFromNow)
-                self.db.timeFromNow = timeFromNow
-            except:
-                print("User entered non-number")
-                self.db.timeFromNow = -1
-        if self.airlineCheck.isChecked():
-            self.db.desiredAirline = self.sanitizeInput(self.airlineText.text())
-        if self.airportCheck.isChecked():
-            self.db.desiredOrigin = self.sanitizeInput(self.departureText.text())
-            self.db.desiredDest = self.sanitizeInput(self.arrivalText.text())
-        result = self.db.getRandomRoute()
+        if not self.readTextFilters():
+            return
+        result = self.runQuery(self.db.getRandomRoute)
+        if result == None:
+            return
         self.displayOutput(result)
 
     def displayLeg(self):
@@ -413,89 +590,7 @@ class Ui_FlightScheduler(QWidget):
             self.outputText.setText(self.printLeg(legData[0][wantedIndex]))
 
     def printLeg(self,chosenLeg):
-        try:
-            baseString = self.db.getAirlineFull(chosenLeg[1])+" "+chosenLeg[1]+str(chosenLeg[2])+", "+self.getSeason(chosenLeg[3])+" "+str(chosenLeg[4])+"\n"
-            baseString += str(self.db.getAircraftDetails(chosenLeg[-1])[1])+" "+chosenLeg[-3]+"\n"
-        except Exception:
-            a = 4
-#        if chosenLeg[5] != "NULL":
-#            baseString += chosenLeg[5]+"\n"
-        if chosenLeg[-2] != "NULL":
-            baseString += chosenLeg[-2]+"\n"
-        baseString += "Planned block time: "+self.formatTime(chosenLeg[-4])+"\n"
-        baseString += "\nDepart:\n"
-        depDetails = self.db.getAirportDetails(chosenLeg[7])
-        arrDetails = self.db.getAirportDetails(chosenLeg[8])
-        baseString += depDetails[-1]+" ("+chosenLeg[7]+")\n"
-        locString = depDetails[3]
-        if(depDetails[4] != "NULL"):
-            locString+=", "+depDetails[4]
-        baseString+= locString+", "+depDetails[-2]+"\n"
-        utc = self.timeToString(chosenLeg[9])
-        if chosenLeg[3] == 1:
-            depLocalTime = self.timeToString(chosenLeg[9]+self.getTimeOffset(chosenLeg[9],depDetails[1]))
-        else:
-            depLocalTime = self.timeToString(chosenLeg[9]+self.getTimeOffset(chosenLeg[9],depDetails[2]))
-        baseString += self.getDayString(depLocalTime[0])+" "+depLocalTime[1]+" ("+utc[1]+" UTC)\n"
-        baseString += "\nArrive:\n"+arrDetails[-1]+" ("+chosenLeg[8]+")\n"
-        locString = arrDetails[3]
-        if(arrDetails[4] != "NULL"):
-            locString+=", "+arrDetails[4]
-        baseString += locString+", "+arrDetails[-2]+"\n"
-        utc = self.timeToString(chosenLeg[10])
-        if chosenLeg[3] == 1:
-            arrLocalTime = self.timeToString(chosenLeg[10]+self.getTimeOffset(chosenLeg[10],arrDetails[1]))
-        else:
-            arrLocalTime = self.timeToString(chosenLeg[10]+self.getTimeOffset(chosenLeg[10],arrDetails[2]))
-        baseString += self.getDayString(arrLocalTime[0])+" "+arrLocalTime[1]+" ("+utc[1]+" UTC)\n"
-        return baseString
-
-    def getDayString(self,dayInt):
-        if dayInt == 1:
-            return "Monday"
-        if dayInt == 2:
-            return "Tuesday"
-        if dayInt == 3:
-            return "Wednesday"
-        if dayInt == 4:
-            return "Thursday"
-        if dayInt == 5:
-            return "Friday"
-        if dayInt == 6:
-            return "Saturday"
-        if dayInt == 7:
-            return "Sunday"
-
-    def timeToString(self,rawTime):
-        if rawTime > 10080:
-            rawTime -= 10080
-        if rawTime < 1:
-            rawTime += 10080
-        day = (rawTime // (24*60))
-        hour = (rawTime - (day*24*60)) // 60
-        minute = rawTime - (day*24*60) - (hour*60)
-        hourString = str(hour)
-        minuteString = str(minute)
-        if len(hourString) == 1:
-            hourString = '0'+hourString
-        if len(minuteString) == 1:
-            minuteString = '0'+minuteString
-        return [day+1,hourString+":"+minuteString]
-
-    def getTimeOffset(self,rawTime,timezone):
-        timeOffset = timezone.split(":")
-        sign = timeOffset[0][0]
-        hour = int(timeOffset[0][1:])
-        minute = int(timeOffset[1])
-        if sign == '+':
-            return minute + (hour*60)
-        else:
-            return -(minute+(hour*60))
-
-    def getSeason(self,season):
-        if season == 1:
-            return "Summer"
-        return "Winter"
+        return self.renderer.renderLeg(chosenLeg)
 
     def sendAircraft(self):
         resultArray = []
@@ -503,6 +598,7 @@ class Ui_FlightScheduler(QWidget):
             if self.current_subTypeVector[subType] == True:
                 resultArray.append(subType)
         self.db.desiredAircraft = resultArray
+        self.liveRefresh()
 
     def sanitizeInput(self,input):
         array = input.upper().split(',')
@@ -520,6 +616,7 @@ class Ui_FlightScheduler(QWidget):
             self.departureText.setDisabled(True)
             self.db.desiredDest = []
             self.db.desiredOrigin = []
+        self.liveRefresh()
 
     def airlineCheckChange(self):
         if self.airlineCheck.isChecked():
@@ -528,6 +625,7 @@ class Ui_FlightScheduler(QWidget):
         else:
             self.airlineText.setDisabled(True)
             self.db.desiredAirline = []
+        self.liveRefresh()
 
     def resetButtonPressed(self):
         #####Clear table
@@ -537,17 +635,6 @@ class Ui_FlightScheduler(QWidget):
         self.cargoCheckBox.setChecked(True)
         self.reset=False
 
-    def formatTime(self,rawminutes):
-        hours = rawminutes//60
-        minutes = int(rawminutes - (hours*60))
-        minuteString = str(minutes)
-        if len(minuteString) == 1:
-            minuteString = '0'+minuteString
-        hourString = str(hours)
-        if len(hourString) == 1:
-            hourString = '0'+hourString
-        return str(hourString)+":"+str(minuteString)
-
     def paxCheckChange(self,state):
         for index in range(self.subTypeList.count()-1,-1,-1):
             for typeCode in self.acSchema[1].keys():
@@ -619,26 +706,31 @@ class Ui_FlightScheduler(QWidget):
         if self.anyDuration_btn.isChecked():
             self.db.maxDuration = -1
             self.db.minDuration = -1
+            self.liveRefresh()
 
     def setShortDuration(self):
         if self.shortDuration_btn.isChecked():
             self.db.maxDuration = 121
             self.db.minDuration = 0
+            self.liveRefresh()
 
     def setMedDuration(self):
         if self.medDuration_btn.isChecked():
             self.db.maxDuration = 241
             self.db.minDuration = 120
+            self.liveRefresh()
 
     def setLongDuration(self):
         if self.longDuration_btn.isChecked():
             self.db.maxDuration = 601
             self.db.minDuration = 240
+            self.liveRefresh()
 
     def setUltraDuration(self):
         if self.ultraLongDuration_btn.isChecked():
             self.db.minDuration = 599
             self.db.maxDuration = 1000000
+            self.liveRefresh()
 
     def subTypeClicked(self,item):
         for key,val in self.acSchema[1].items():
@@ -1,12 +1,25 @@
 import sys
-import shutil
+import os
 
 from cx_Freeze import setup, Executable
+from prepareDatabase import prepareDatabase
 
-#base = None
-#if sys.platform == "win32":
-#    base = "Win32GUI"
+here = os.path.dirname(os.path.abspath(__file__))
+buildDir = os.path.join(here,"build","FlightScheduler-"+sys.platform)
 
-setup(name='FlightScheduler',version='0.3',executables = [Executable("Gui_ui.py",base = "Win32GUI",targetName="Flight Scheduler.exe",icon="FS 1.6 Icon.ico")])
+####indexed, analysed and vacuumed DB plus aircraft cache and snapshot, shipped next to the executable
+includeFiles = []
+for output in prepareDatabase(os.path.join(here,"FlightDB.db"),os.path.join(here,"build","prepared")):
+    includeFiles.append((output,os.path.basename(output)))
 
-shutil.copyfile("C:\\Users\Anders\\PycharmProjects\\FdbFrontEnd\\FlightDB.db","C:\\Users\\Anders\\PycharmProjects\\FdbFrontEnd\\build\\exe.win32-3.4\\FlightDB.db")
+base = None
+targetName = "flight-scheduler"
+icon = None
+if sys.platform == "win32":
+    base = "Win32GUI"
+    targetName = "Flight Scheduler.exe"
+    icon = os.path.join(here,"FS 1.6 Icon.ico")
+
+setup(name='FlightScheduler',version='0.3',
+      options={"build_exe":{"build_exe":buildDir,"include_files":includeFiles,"optimize":2}},
+      executables=[Executable(os.path.join(here,"Gui_ui.py"),base=base,target_name=targetName,icon=icon)])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Departures board window, advances the DepartureBoard window on a timer.
+"""
+from PyQt5 import QtCore, QtWidgets
+from departureBoard import DepartureBoard
+
+class BoardPanel(QtWidgets.QDialog):
+
+    def __init__(self,parent=None,rows=20):
+        QtWidgets.QDialog.__init__(self,parent)
+        self.setWindowTitle("Next departures (UTC)")
+        self.resize(520,480)
+        self.rows = rows
+        self.board = None
+        self.verticalLayout = QtWidgets.QVBoxLayout(self)
+        self.boardList = QtWidgets.QListWidget(self)
+        self.verticalLayout.addWidget(self.boardList)
+        ####advance is a no-op until the minute changes, polling just keeps the board on time
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(5000)
+
+    def load(self,db):
+        self.board = DepartureBoard(db)
+        self.render()
+
+    def tick(self):
+        if not self.board == None and self.isVisible() and self.board.advance():
+            self.render()
+
+    def render(self):
+        self.boardList.clear()
+        lines = self.board.lines(self.rows)
+        if self.board.truncated:
+            self.boardList.addItem("Only the first "+str(self.board.db.maxRows)+" legs were loaded, narrow the filters")
+        if len(lines) == 0:
+            self.boardList.addItem("No departures in the next "+str(self.board.horizon)+" minutes")
+        for line in lines:
+            self.boardList.addItem(line)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Upcoming departures board.
+
+Legs matching the active filters are loaded once and sorted by departure
+minute of the week. A window of the next horizon minutes then slides forward
+with the clock: each minute expired legs drop off the front and newly due legs
+are appended from a pointer into the sorted list, no query is re-run.
+
+Run as a script for a terminal board:
+python departureBoard.py FlightDB.db [rows] [origin airports]
+"""
+from collections import deque
+from time import time
+from legRenderer import weekTime
+
+WEEK = 10080
+####the unix epoch was a Thursday, shift so absolute minute % WEEK is minute of the week from Monday
+EPOCH_OFFSET = 3*1440
+
+def absoluteMinute(now=None):
+    if now == None:
+        now = time()
+    return int(now//60)+EPOCH_OFFSET
+
+class DepartureBoard:
+
+    def __init__(self,db,horizon=120):
+        self.db = db
+        self.horizon = horizon
+        self.reload()
+
+    def reload(self):
+        ####truncated is set when the leg cap was hit, the board then only covers part of the schedule
+        legs,self.truncated = self.db.getBoardLegs()
+        legs.sort(key=lambda leg: leg[5] % WEEK)
+        self.legs = legs
+        self.times = [leg[5] % WEEK for leg in legs]
+        self.window = deque()
+        self.currentMinute = None
+
+    def advance(self,now=None):
+        minute = absoluteMinute(now)
+        if minute == self.currentMinute or len(self.legs) == 0:
+            return False
+        if self.currentMinute == None or minute < self.currentMinute or minute-self.currentMinute > self.horizon:
+            self.seek(minute)
+        ####expire from the front, admit from the pointer, both only touch legs that change
+        while len(self.window) > 0 and self.window[0][0] < minute:
+            self.window.popleft()
+        end = minute+self.horizon
+        while True:
+            due = self.lap*WEEK+self.times[self.nextIndex]
+            if due >= end:
+                break
+            self.window.append((due,self.nextIndex))
+            self.nextIndex += 1
+            if self.nextIndex == len(self.times):
+                self.nextIndex = 0
+                self.lap += 1
+        self.currentMinute = minute
+        return True
+
+    def seek(self,minute):
+        ####binary search for the first leg at or after minute, used on start and after a jump
+        low = 0
+        high = len(self.times)
+        target = minute % WEEK
+        while low < high:
+            middle = (low+high)//2
+            if self.times[middle] < target:
+                low = middle+1
+            else:
+                high = middle
+        self.lap = minute//WEEK
+        self.nextIndex = low
+        if low == len(self.times):
+            self.nextIndex = 0
+            self.lap += 1
+        self.window = deque()
+
+    def upcoming(self,count=20):
+        self.advance()
+        return [self.legs[index] for due,index in list(self.window)[:count]]
+
+    def lines(self,count=20):
+        result = []
+        for leg in self.upcoming(count):
+            day,clock = weekTime(leg[5])
+            result.append(day[:3]+" "+clock+"  "+(leg[1]+str(leg[2])).ljust(8)+" "+leg[3]+" - "+leg[4]+"  "+str(leg[6]).ljust(5)+" "+str(leg[7]))
+        return result
+
+if __name__ == '__main__':
+    import sys
+    import time as clock
+    from sqLiteManagerGUI import sqLiteDB
+    db = sqLiteDB(sys.argv[1],readOnly=True)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    if len(sys.argv) > 3:
+        db.desiredOrigin = sys.argv[3].upper().split(',')
+    board = DepartureBoard(db)
+    while True:
+        if board.advance():
+            print("\nNext departures (UTC)")
+            if board.truncated:
+                print("Only the first "+str(db.maxRows)+" legs were loaded, narrow the filters")
+            for line in board.lines(count):
+                print(line)
+        clock.sleep(5)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index over airport locations and precomputed leg distances.
+
+buildGeoIndex adds an rtree over airport coordinates (AirportRtree/AirportGeo)
+and the great circle distance of every leg (LegDistance) to the database, so
+radius, country and distance filters become indexed lookups.
+"""
+import sqlite3
+from math import radians, degrees, sin, cos, asin, sqrt
+
+EARTH_RADIUS = 6371.0
+
+def greatCircle(lat1,lon1,lat2,lon2):
+    if lat1 == None or lat2 == None:
+        return None
+    lat1,lon1,lat2,lon2 = radians(lat1),radians(lon1),radians(lat2),radians(lon2)
+    a = sin((lat2-lat1)/2)**2 + cos(lat1)*cos(lat2)*sin((lon2-lon1)/2)**2
+    return 2*EARTH_RADIUS*asin(min(1.0,sqrt(a)))
+
+def boundingBox(lat,lon,km):
+    dLat = degrees(km/EARTH_RADIUS)
+    minLat = max(-90.0,lat-dLat)
+    maxLat = min(90.0,lat+dLat)
+    ####near the poles or across the date line just take every longitude
+    if maxLat == 90.0 or minLat == -90.0:
+        return (minLat,maxLat,-180.0,180.0)
+    dLon = degrees(asin(min(1.0,sin(km/EARTH_RADIUS)/cos(radians(lat)))))
+    if lon-dLon < -180.0 or lon+dLon > 180.0:
+        return (minLat,maxLat,-180.0,180.0)
+    return (minLat,maxLat,lon-dLon,lon+dLon)
+
+def coordinateColumns(cursor):
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(Airport)").fetchall()]
+    latColumn = None
+    lonColumn = None
+    for column in columns:
+        if column.lower() in ("latitude","lat"):
+            latColumn = column
+        if column.lower() in ("longitude","lon","lng","long"):
+            lonColumn = column
+    if latColumn == None or lonColumn == None:
+        raise ValueError("Airport table has no latitude/longitude columns")
+    ####country sits where printLeg expects it
+    return ("airportCode",columns[-2],latColumn,lonColumn)
+
+def buildGeoIndex(filePath):
+    con = sqlite3.connect(filePath)
+    con.text_factory = str
+    cursor = con.cursor()
+    codeColumn,countryColumn,latColumn,lonColumn = coordinateColumns(cursor)
+    airports = cursor.execute("SELECT "+codeColumn+","+countryColumn+","+latColumn+","+lonColumn+" FROM Airport").fetchall()
+    cursor.execute("DROP TABLE IF EXISTS AirportRtree")
+    cursor.execute("DROP TABLE IF EXISTS AirportGeo")
+    cursor.execute("DROP TABLE IF EXISTS LegDistance")
+    cursor.execute("CREATE VIRTUAL TABLE AirportRtree USING rtree(id,minLat,maxLat,minLon,maxLon)")
+    cursor.execute("CREATE TABLE AirportGeo (id INTEGER PRIMARY KEY,airportCode TEXT,country TEXT,latitude REAL,longitude REAL)")
+    cursor.execute("CREATE TABLE LegDistance (legId INTEGER PRIMARY KEY,distance REAL)")
+    locations = {}
+    for index,(code,country,lat,lon) in enumerate(airports):
+        if lat == None or lon == None or lat == "NULL" or lon == "NULL":
+            continue
+        lat = float(lat)
+        lon = float(lon)
+        locations[code] = (lat,lon)
+        cursor.execute("INSERT INTO AirportGeo VALUES (?,?,?,?,?)",(index+1,code,country,lat,lon))
+        cursor.execute("INSERT INTO AirportRtree VALUES (?,?,?,?,?)",(index+1,lat,lat,lon,lon))
+    cursor.execute("CREATE INDEX AirportGeoCode ON AirportGeo (airportCode)")
+    cursor.execute("CREATE INDEX AirportGeoCountry ON AirportGeo (country)")
+    distances = []
+    for legId,origin,destination in cursor.execute("SELECT legId,origin,destination FROM Leg").fetchall():
+        if origin in locations and destination in locations:
+            distances.append((legId,greatCircle(*(locations[origin]+locations[destination]))))
+    cursor.executemany("INSERT INTO LegDistance VALUES (?,?)",distances)
+    cursor.execute("CREATE INDEX LegDistanceDistance ON LegDistance (distance)")
+    con.commit()
+    cursor.close()
+    con.close()
+    return len(distances)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental filter evaluation over a ScheduleSnapshot.
+
+Keeps one boolean mask per filter dimension plus the candidate mask (the AND of
+all of them). When a single GUI control changes only the rows touched by that
+change are revisited: rows leaving the dimension are cleared from the
+candidates in place, rows entering it are re-checked against the other
+dimensions.
+"""
+import numpy as np
+
+class IncrementalFilter:
+
+    def __init__(self,snapshot):
+        self.snapshot = snapshot
+        self.candidate = np.ones(snapshot.rows,dtype=bool)
+        self.dimensions = {}
+        self.state = {}
+        self.codeRows = {}
+        self.eraRows = {}
+
+    def dimension(self,name):
+        if not name in self.dimensions:
+            self.dimensions[name] = np.ones(self.snapshot.rows,dtype=bool)
+        return self.dimensions[name]
+
+    def rowsForCode(self,column,code):
+        ####rows grouped by dictionary code, built once per column with a single sort
+        if not column in self.codeRows:
+            values = self.snapshot.columns[column]
+            order = np.argsort(values,kind="stable")
+            bounds = np.concatenate(([0],np.cumsum(np.bincount(values,minlength=len(self.snapshot.dictionaries[self.snapshot.columnDict[column]])))))
+            self.codeRows[column] = (order,bounds)
+        index = self.snapshot.codeIndex[self.snapshot.columnDict[column]]
+        if not code in index:
+            return np.zeros(0,dtype=np.intp)
+        order,bounds = self.codeRows[column]
+        value = index[code]
+        return order[bounds[value]:bounds[value+1]]
+
+    def rowsForEra(self,era):
+        if not era in self.eraRows:
+            oneEra = [0,0,0,0,0,0,0]
+            oneEra[era] = 1
+            self.eraRows[era] = np.flatnonzero(self.snapshot.eraMask(oneEra))
+        return self.eraRows[era]
+
+    def recheck(self,rows):
+        if len(rows) == 0:
+            return
+        passed = np.ones(len(rows),dtype=bool)
+        for mask in self.dimensions.values():
+            passed &= mask[rows]
+        self.candidate[rows] = passed
+
+    def setMask(self,name,newMask):
+        oldMask = self.dimension(name)
+        added = np.flatnonzero(newMask & ~oldMask)
+        ####tightening only ever clears candidates, no other dimension is consulted
+        self.candidate &= newMask
+        self.dimensions[name] = newMask
+        self.recheck(added)
+
+    def setValues(self,name,rowsFor,oldValues,newValues):
+        mask = self.dimension(name)
+        if oldValues == None:
+            ####filter switched on, start from an empty dimension and narrow candidates
+            mask[:] = False
+            for value in newValues:
+                mask[rowsFor(value)] = True
+            self.candidate &= mask
+        elif newValues == None:
+            excluded = np.flatnonzero(~mask)
+            mask[:] = True
+            self.recheck(excluded)
+        else:
+            for value in oldValues - newValues:
+                rows = rowsFor(value)
+                mask[rows] = False
+                self.candidate[rows] = False
+            for value in newValues - oldValues:
+                rows = rowsFor(value)
+                mask[rows] = True
+                self.recheck(rows)
+
+    def codeValues(self,codes,alwaysActive=False):
+        if len(codes) == 0 or (not alwaysActive and codes[0] == ""):
+            return None
+        return frozenset(codes)
+
+    def sync(self,db):
+        changed = []
+        wanted = {"airline":self.codeValues(db.desiredAirline),
+                  "origin":self.codeValues(db.desiredOrigin),
+                  "destination":self.codeValues(db.desiredDest),
+                  "aircraft":self.codeValues(db.desiredAircraft,True),
+                  "era":None,
+                  "duration":None,
+                  "window":db.currentTimeWindow()}
+        if 0 in db.desiredEras:
+            wanted["era"] = frozenset(i for i,value in enumerate(db.desiredEras) if value == 1)
+        if not db.minDuration == -1:
+            wanted["duration"] = (db.minDuration,db.maxDuration)
+        for name,value in wanted.items():
+            oldValue = self.state.get(name)
+            if value == oldValue:
+                continue
+            if name == "era":
+                self.setValues(name,self.rowsForEra,oldValue,value)
+            elif name == "duration":
+                if value == None:
+                    self.setMask(name,np.ones(self.snapshot.rows,dtype=bool))
+                else:
+                    duration = self.snapshot.columns["duration"]
+                    self.setMask(name,(duration > value[0]) & (duration < value[1]))
+            elif name == "window":
+                if value == None:
+                    self.setMask(name,np.ones(self.snapshot.rows,dtype=bool))
+                else:
+                    self.setMask(name,self.snapshot.windowMask(value))
+            else:
+                self.setValues(name,lambda code,column=name: self.rowsForCode(column,code),oldValue,value)
+            self.state[name] = value
+            changed.append(name)
+        return changed
+
+    def routes(self,db):
+        self.sync(db)
+        return self.snapshot.routesFromMask(self.candidate)
+
+    def sampleFlights(self,db,count=1):
+        self.sync(db)
+        return self.snapshot.sampleFromMask(self.candidate,db.sampleStrata,db.recentFlights,count)
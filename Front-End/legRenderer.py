@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk text/JSON rendering of legs.
+
+Airport time zones are parsed to integer minutes once, airline, aircraft and
+airport details are loaded once, and day names and zero padded HH:MM strings
+come from lookup tables, so rendering a leg is lookups and one string join.
+Rows are Flight NATURAL JOIN Leg rows, as used by printLeg.
+
+Run as a script for a benchmark: python legRenderer.py FlightDB.db [legs]
+"""
+import json
+
+DAY_NAMES = ("Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday")
+CLOCK = tuple("%02d:%02d" % (minute//60,minute % 60) for minute in range(24*60))
+
+def parseOffset(timezone):
+    try:
+        hours,minutes = timezone.split(":")
+        offset = int(hours[1:])*60+int(minutes)
+    except (AttributeError,ValueError):
+        return 0
+    if hours[0] == "-":
+        return -offset
+    return offset
+
+def weekTime(rawTime):
+    ####one week of wrap either way, minute 10080 is Monday 00:00
+    if rawTime > 10080:
+        rawTime -= 10080
+    if rawTime < 1:
+        rawTime += 10080
+    return (DAY_NAMES[(rawTime//1440) % 7],CLOCK[rawTime % 1440])
+
+def blockTime(minutes):
+    if minutes < 1440:
+        return CLOCK[minutes]
+    return "%02d:%02d" % (minutes//60,minutes % 60)
+
+class LegRenderer:
+
+    def __init__(self,db):
+        self.airlines = dict(db.pullAirlines())
+        self.aircraft = {}
+        for code,row in db.pullAircraftTable().items():
+            self.aircraft[code] = str(row[1])
+        self.airports = {}
+        for code,row in db.pullAirportTable().items():
+            ####built for every airport at startup, a missing city, state or country is left out rather than failing
+            location = [part for part in (row[3],row[4],row[-2]) if not part in (None,"","NULL")]
+            ####(summer offset,winter offset,name line without code,location line)
+            self.airports[code] = (parseOffset(row[1]),parseOffset(row[2]),row[-1]+" (" if row[-1] else "(",", ".join(location)+"\n")
+
+    def airport(self,code):
+        if code in self.airports:
+            return self.airports[code]
+        return (0,0,"Unknown airport (",code+"\n")
+
+    def renderLeg(self,leg):
+        parts = [self.airlines.get(leg[1],leg[1])," ",leg[1],str(leg[2]),", ","Summer" if leg[3] == 1 else "Winter"," ",str(leg[4]),"\n",
+                 self.aircraft.get(leg[-1],str(leg[-1]))," ",str(leg[-3]),"\n"]
+        if leg[-2] != "NULL":
+            parts += [leg[-2],"\n"]
+        parts += ["Planned block time: ",blockTime(leg[-4]),"\n"]
+        for title,code,rawTime in (("\nDepart:\n",leg[7],leg[9]),("\nArrive:\n",leg[8],leg[10])):
+            summer,winter,name,location = self.airport(code)
+            day,localTime = weekTime(rawTime+(summer if leg[3] == 1 else winter))
+            parts += [title,name,code,")\n",location,day," ",localTime," (",weekTime(rawTime)[1]," UTC)\n"]
+        return "".join(parts)
+
+    def renderLegs(self,legs):
+        renderLeg = self.renderLeg
+        return [renderLeg(leg) for leg in legs]
+
+    def legRecord(self,leg):
+        record = {"airline":leg[1],"airlineName":self.airlines.get(leg[1]),"flight":leg[1]+str(leg[2]),
+                  "season":"Summer" if leg[3] == 1 else "Winter","year":leg[4],"aircraft":leg[-1],
+                  "registration":leg[-3],"remarks":None if leg[-2] == "NULL" else leg[-2],"blockTime":blockTime(leg[-4])}
+        for key,code,rawTime in (("departure",leg[7],leg[9]),("arrival",leg[8],leg[10])):
+            summer,winter,name,location = self.airport(code)
+            day,localTime = weekTime(rawTime+(summer if leg[3] == 1 else winter))
+            record[key] = {"airport":code,"day":day,"local":localTime,"utc":weekTime(rawTime)[1]}
+        return record
+
+    def renderLegsJson(self,legs):
+        legRecord = self.legRecord
+        return json.dumps([legRecord(leg) for leg in legs])
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from sqLiteManagerGUI import sqLiteDB
+    db = sqLiteDB(sys.argv[1],readOnly=True)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    cursor = db.dbOpen(db.filePath)
+    sample = cursor.execute("SELECT * FROM Flight NATURAL JOIN Leg LIMIT 10000").fetchall()
+    cursor.close()
+    db.dbClose()
+    legs = (sample*(count//len(sample)+1))[:count]
+    start = time.time()
+    renderer = LegRenderer(db)
+    print("Setup: %.3fs" % (time.time()-start))
+    start = time.time()
+    renderer.renderLegs(legs)
+    elapsed = time.time()-start
+    print("Text: %d legs in %.2fs (%.0f legs/s)" % (count,elapsed,count/elapsed))
+    start = time.time()
+    renderer.renderLegsJson(legs)
+    elapsed = time.time()-start
+    print("JSON: %d legs in %.2fs (%.0f legs/s)" % (count,elapsed,count/elapsed))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+In memory prefix tries for airline and airport autocomplete and validation.
+
+Built once from the Airline and Airport tables, every keystroke is then a walk
+down the trie instead of a query.
+"""
+
+class PrefixTrie:
+
+    def __init__(self):
+        ####[children,values], values is a dict used as an insertion ordered set
+        self.root = [{},{}]
+
+    def insert(self,key,value):
+        node = self.root
+        for char in key.upper():
+            if not char in node[0]:
+                node[0][char] = [{},{}]
+            node = node[0][char]
+        ####words like "International" collect an entry per airport, membership has to stay O(1)
+        node[1][value] = None
+
+    def complete(self,prefix,limit=10):
+        node = self.root
+        for char in prefix.upper():
+            if not char in node[0]:
+                return []
+            node = node[0][char]
+        ####breadth first so shorter (closer) keys come first
+        results = []
+        level = [node]
+        while len(level) > 0 and len(results) < limit:
+            nextLevel = []
+            for current in level:
+                for value in current[1]:
+                    if not value in results:
+                        results.append(value)
+                        if len(results) == limit:
+                            return results
+                for char in sorted(current[0].keys()):
+                    nextLevel.append(current[0][char])
+            level = nextLevel
+        return results
+
+class CodeCompleter:
+
+    def __init__(self,db):
+        self.airlineTrie = PrefixTrie()
+        self.airportTrie = PrefixTrie()
+        self.airlineNames = {}
+        self.airportNames = {}
+        for code,fullName in db.pullAirlines():
+            if code == None:
+                continue
+            fullName = fullName or ""
+            self.airlineNames[code.upper()] = fullName
+            self.indexName(self.airlineTrie,code,code)
+            self.indexName(self.airlineTrie,fullName,code)
+        for code,city,name in db.pullAirports():
+            if code == None:
+                continue
+            self.airportNames[code.upper()] = name or ""
+            self.indexName(self.airportTrie,code,code)
+            for text in (city,name):
+                if not text == None and not text == "NULL":
+                    self.indexName(self.airportTrie,text,code)
+
+    def indexName(self,trie,text,code):
+        ####whole text plus every word, so "airways" finds "British Airways"
+        trie.insert(text,code)
+        words = text.split()
+        if len(words) > 1:
+            for word in words:
+                trie.insert(word,code)
+
+    def suggestAirlines(self,prefix,limit=10):
+        return self.suggest(self.airlineTrie,self.airlineNames,prefix,limit)
+
+    def suggestAirports(self,prefix,limit=10):
+        return self.suggest(self.airportTrie,self.airportNames,prefix,limit)
+
+    def suggest(self,trie,names,prefix,limit):
+        prefix = prefix.strip()
+        if prefix == "":
+            return []
+        suggestions = []
+        for code in trie.complete(prefix,limit):
+            suggestions.append(code+" - "+names[code.upper()])
+        return suggestions
+
+    def unknownAirlines(self,codes):
+        return [code for code in codes if not code == "" and not code in self.airlineNames]
+
+    def unknownAirports(self,codes):
+        return [code for code in codes if not code == "" and not code in self.airportNames]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Build step that prepares FlightDB.db for shipping.
+
+Copies the schedule, adds the query indexes and the precomputed geo and
+rotation tables, runs ANALYZE and VACUUM, and writes the aircraft catalogue
+cache and (with numpy) the columnar snapshot next to it, so a fresh install
+does no warm-up work on its first query.
+
+python prepareDatabase.py FlightDB.db outputDir
+"""
+import os
+import json
+import sqlite3
+from storageBackend import createIndexes
+from geoIndex import buildGeoIndex
+from rotationTracker import buildRotationTable
+
+def writeAircraftCache(filePath):
+    from sqLiteManagerGUI import sqLiteDB
+    db = sqLiteDB(filePath,readOnly=True)
+    db.aircraftCachePath = None
+    famDict,nameDict,roleDict = db.pullAircraft()
+    cachePath = os.path.splitext(filePath)[0]+".aircraft.json"
+    with open(cachePath,"w") as cacheFile:
+        json.dump({"families":famDict,"names":nameDict,"roles":roleDict},cacheFile)
+    return cachePath
+
+def prepareDatabase(sourcePath,outputDir):
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    filePath = os.path.join(outputDir,os.path.basename(sourcePath))
+    if os.path.exists(filePath):
+        os.remove(filePath)
+    ####backup API rather than a file copy so a WAL source is copied consistently
+    source = sqlite3.connect(sourcePath)
+    target = sqlite3.connect(filePath)
+    source.backup(target)
+    source.close()
+    target.execute("PRAGMA journal_mode=DELETE")
+    target.close()
+    try:
+        buildGeoIndex(filePath)
+    except ValueError as e:
+        print("Skipping geo index: "+str(e))
+    buildRotationTable(filePath)
+    con = sqlite3.connect(filePath)
+    createIndexes(con)
+    con.execute("VACUUM")
+    con.close()
+    outputs = [filePath,writeAircraftCache(filePath)]
+    try:
+        from scheduleSnapshot import exportSnapshot
+    except ImportError:
+        print("numpy not installed, no snapshot built")
+    else:
+        snapshotPath = os.path.splitext(filePath)[0]+".snapshot"
+        exportSnapshot(filePath,snapshotPath)
+        outputs.append(snapshotPath)
+    return outputs
+
+if __name__ == '__main__':
+    import sys
+    for output in prepareDatabase(sys.argv[1],sys.argv[2]):
+        print(output)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Per registration tail routing.
+
+buildRotationTable orders every leg flown by a registration through the week
+into the indexed Rotation table, so the legs an airframe flies before and after
+any given leg are index lookups rather than full schedule queries. Each year
+and season is its own schedule, so a rotation is keyed on all three.
+"""
+import sqlite3
+
+def buildRotationTable(filePath):
+    con = sqlite3.connect(filePath)
+    con.text_factory = str
+    cursor = con.cursor()
+    cursor.execute("DROP TABLE IF EXISTS Rotation")
+    cursor.execute("CREATE TABLE Rotation (legId INTEGER PRIMARY KEY,flightId INTEGER,registration TEXT,year INTEGER,season INTEGER,departureTime INTEGER,sequence INTEGER)")
+    data = cursor.execute("SELECT legId,flightId,registration,year,season,departureTime FROM Flight NATURAL JOIN Leg WHERE registration IS NOT NULL AND NOT registration IN ('','NULL') ORDER BY registration,year,season,departureTime,legId").fetchall()
+    rows = []
+    lastKey = None
+    sequence = 0
+    for legId,flightId,registration,year,season,departureTime in data:
+        if not (registration,year,season) == lastKey:
+            lastKey = (registration,year,season)
+            sequence = 0
+        rows.append((legId,flightId,registration,year,season,departureTime,sequence))
+        sequence += 1
+    cursor.executemany("INSERT INTO Rotation VALUES (?,?,?,?,?,?,?)",rows)
+    cursor.execute("CREATE UNIQUE INDEX RotationOrder ON Rotation (registration,year,season,sequence)")
+    con.commit()
+    cursor.close()
+    con.close()
+    return len(rows)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar read-only snapshot of the schedule.
+
+Every leg of Flight NATURAL JOIN Leg becomes one row in a set of flat binary
+column files. Airline, airport, aircraft and registration codes are dictionary
+encoded, times and durations are stored as small integers. The columns are
+opened through numpy.memmap so processes on the same host share one page cached
+copy instead of each building Python objects row by row.
+
+meta.json records the Leg table's row count and highest legId at export time,
+sqLiteDB only uses a snapshot while its DB still has the same ones.
+"""
+import os
+import json
+import random
+import sqlite3
+import numpy as np
+from sqLiteManagerGUI import eraBounds
+
+SNAPSHOT_VERSION = 1
+
+####(column,dtype,dictionary) in export order, dictionary of None means stored as is
+legColumns = [("flightId","<i4",None),
+              ("legId","<i4",None),
+              ("airline","<u2","airlines"),
+              ("origin","<u2","airports"),
+              ("destination","<u2","airports"),
+              ("aircraft","<u2","aircraft"),
+              ("registration","<i4","registrations"),
+              ("departureTime","<i2",None),
+              ("arrivalTime","<i2",None),
+              ("duration","<i2",None),
+              ("year","<i2",None),
+              ("season","<i1",None)]
+
+def sourceFingerprint(cursor):
+    ####a reload or a replaced DB changes at least one of these, both come from the legId index
+    return list(cursor.execute("SELECT COUNT(*),MAX(legId) FROM Leg").fetchone())
+
+def exportSnapshot(filePath,snapshotPath,chunkSize=50000):
+    if not os.path.isdir(snapshotPath):
+        os.makedirs(snapshotPath)
+    names = [column[0] for column in legColumns]
+    dictionaries = {}
+    codeIndex = {}
+    codeLimit = {}
+    for name,dtype,dictName in legColumns:
+        if not dictName == None and not dictName in dictionaries:
+            dictionaries[dictName] = []
+            codeIndex[dictName] = {}
+            codeLimit[dictName] = np.iinfo(dtype).max
+    con = sqlite3.connect(filePath)
+    con.text_factory = str
+    cursor = con.cursor()
+    source = sourceFingerprint(cursor)
+    cursor.execute("SELECT "+",".join(names)+" FROM Flight NATURAL JOIN Leg ORDER BY flightId,legId")
+    outFiles = {}
+    for name,dtype,dictName in legColumns:
+        outFiles[name] = open(os.path.join(snapshotPath,name+".bin"),"wb")
+    rows = 0
+    try:
+        while True:
+            chunk = cursor.fetchmany(chunkSize)
+            if len(chunk) == 0:
+                break
+            for position,(name,dtype,dictName) in enumerate(legColumns):
+                values = []
+                if dictName == None:
+                    for row in chunk:
+                        value = row[position]
+                        values.append(0 if value == None else value)
+                else:
+                    index = codeIndex[dictName]
+                    codes = dictionaries[dictName]
+                    for row in chunk:
+                        code = "" if row[position] == None else str(row[position])
+                        if not code in index:
+                            if len(codes) > codeLimit[dictName]:
+                                raise ValueError("Too many distinct "+dictName+" for snapshot")
+                            index[code] = len(codes)
+                            codes.append(code)
+                        values.append(index[code])
+                np.array(values,dtype=dtype).tofile(outFiles[name])
+            rows += len(chunk)
+    finally:
+        for outFile in outFiles.values():
+            outFile.close()
+        cursor.close()
+        con.close()
+    meta = {"version":SNAPSHOT_VERSION,
+            "rows":rows,
+            "source":source,
+            "columns":[[name,dtype,dictName] for name,dtype,dictName in legColumns],
+            "dictionaries":dictionaries}
+    ####meta is written last so a half written snapshot never opens
+    with open(os.path.join(snapshotPath,"meta.json"),"w") as metaFile:
+        json.dump(meta,metaFile)
+    return rows
+
+class ScheduleSnapshot:
+
+    def __init__(self,snapshotPath):
+        self.snapshotPath = snapshotPath
+        with open(os.path.join(snapshotPath,"meta.json")) as metaFile:
+            meta = json.load(metaFile)
+        if not meta["version"] == SNAPSHOT_VERSION:
+            raise ValueError("Unsupported snapshot version "+str(meta["version"]))
+        self.rows = meta["rows"]
+        ####None for snapshots written before the fingerprint, those never match
+        self.source = meta.get("source")
+        self.dictionaries = meta["dictionaries"]
+        self.codeIndex = {}
+        for dictName,codes in self.dictionaries.items():
+            self.codeIndex[dictName] = dict((code,i) for i,code in enumerate(codes))
+        self.columnDict = {}
+        self.columns = {}
+        for name,dtype,dictName in meta["columns"]:
+            self.columnDict[name] = dictName
+            if self.rows == 0:
+                self.columns[name] = np.zeros(0,dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(snapshotPath,name+".bin"),dtype=dtype,mode="r",shape=(self.rows,))
+
+    def encode(self,column,codes):
+        index = self.codeIndex[self.columnDict[column]]
+        return np.array([index[code] for code in codes if code in index],dtype=self.columns[column].dtype)
+
+    def decode(self,column,values):
+        codes = self.dictionaries[self.columnDict[column]]
+        return [codes[value] for value in values]
+
+    def codeMask(self,column,codes):
+        return np.isin(self.columns[column],self.encode(column,codes))
+
+    def filterMask(self,db):
+        mask = np.ones(self.rows,dtype=bool)
+        if len(db.desiredAirline) > 0 and not db.desiredAirline[0] == "":
+            mask &= self.codeMask("airline",db.desiredAirline)
+        if len(db.desiredOrigin) > 0 and not db.desiredOrigin[0] == "":
+            mask &= self.codeMask("origin",db.desiredOrigin)
+        if len(db.desiredDest) > 0 and not db.desiredDest[0] == "":
+            mask &= self.codeMask("destination",db.desiredDest)
+        if len(db.desiredAircraft) > 0:
+            mask &= self.codeMask("aircraft",db.desiredAircraft)
+        if not db.minDuration == -1:
+            duration = self.columns["duration"]
+            mask &= (duration > db.minDuration) & (duration < db.maxDuration)
+        window = db.currentTimeWindow()
+        if not window == None:
+            mask &= self.windowMask(window)
+        if 0 in db.desiredEras:
+            mask &= self.eraMask(db.desiredEras)
+        return mask
+
+    def windowMask(self,window):
+        time,priorTime = window
+        departure = self.columns["departureTime"]
+        if priorTime > time:
+            return (departure > time) & (departure < priorTime)
+        return (departure > time) | (departure < priorTime)
+
+    def eraMask(self,desiredEras):
+        year = self.columns["year"]
+        mask = np.zeros(self.rows,dtype=bool)
+        for index,value in enumerate(desiredEras):
+            if value == 1:
+                low,high = eraBounds[index]
+                if high == None:
+                    mask |= year > low
+                else:
+                    mask |= (year > low) & (year < high)
+        return mask
+
+    def sampleFlights(self,db,count=1):
+        return self.sampleFromMask(self.filterMask(db),db.sampleStrata,db.recentFlights,count)
+
+    def strataKeys(self,rows,strata):
+        if strata == "registration":
+            return self.columns["registration"][rows]
+        if strata == "airline":
+            return self.columns["airline"][rows]
+        if strata == "route":
+            return self.columns["origin"][rows].astype(np.int64)*65536+self.columns["destination"][rows]
+        return rows
+
+    def sampleFromMask(self,mask,strata="registration",recent=(),count=1):
+        ####same sampling as sqLiteDB.materializedSample, done on arrays
+        candidates = np.flatnonzero(mask)
+        flightIds = self.columns["flightId"][candidates]
+        seen = np.isin(flightIds,np.array(list(recent),dtype=np.int64))
+        keys = self.strataKeys(candidates,strata)
+        chosen = []
+        chosenFlights = set()
+        self.drawStratified(np.flatnonzero(~seen),keys,flightIds,count,chosen,chosenFlights)
+        ####recently seen flights only come back once everything else is used up
+        if len(chosen) < count:
+            self.drawStratified(np.arange(len(candidates)),keys,flightIds,count,chosen,chosenFlights)
+        return [(int(self.columns["legId"][candidates[pick]]),flightId) for pick,flightId in chosen]
+
+    def drawStratified(self,rows,keys,flightIds,count,chosen,chosenFlights):
+        ####sqLiteDB.drawStratified on arrays, strata are grouped once then drawn without replacement
+        if len(rows) == 0:
+            return
+        inverse = np.unique(keys[rows],return_inverse=True)[1]
+        grouped = rows[np.argsort(inverse,kind="stable")]
+        sizes = np.bincount(inverse).tolist()
+        starts = [0]
+        for size in sizes[:-1]:
+            starts.append(starts[-1]+size)
+        live = list(range(len(sizes)))
+        while len(chosen) < count and len(live) > 0:
+            index = random.randrange(len(live))
+            stratum = live[index]
+            position = starts[stratum]+random.randrange(sizes[stratum])
+            last = starts[stratum]+sizes[stratum]-1
+            pick = int(grouped[position])
+            grouped[position] = grouped[last]
+            sizes[stratum] -= 1
+            if sizes[stratum] == 0:
+                live[index] = live[-1]
+                live.pop()
+            flightId = int(flightIds[pick])
+            if not flightId in chosenFlights:
+                chosenFlights.add(flightId)
+                chosen.append((pick,flightId))
+
+    def routeKeys(self,rows):
+        key = self.columns["airline"][rows].astype(np.uint64) << np.uint64(48)
+        key |= self.columns["origin"][rows].astype(np.uint64) << np.uint64(32)
+        key |= self.columns["destination"][rows].astype(np.uint64) << np.uint64(16)
+        key |= self.columns["aircraft"][rows].astype(np.uint64)
+        return key
+
+    def decodeRoutes(self,keys):
+        airlines = self.dictionaries["airlines"]
+        airports = self.dictionaries["airports"]
+        aircraft = self.dictionaries["aircraft"]
+        routes = []
+        for key in keys.tolist():
+            routes.append((airlines[key >> 48],airports[(key >> 32) & 0xFFFF],airports[(key >> 16) & 0xFFFF],aircraft[key & 0xFFFF]))
+        routes.sort()
+        return routes
+
+    def routes(self,db):
+        return self.routesFromMask(self.filterMask(db))
+
+    def routesFromMask(self,mask):
+        return self.decodeRoutes(np.unique(self.routeKeys(np.flatnonzero(mask))))
+
+    def statistic(self,name,mask,arg,aircraftClasses):
+        ####vectorised equivalents of sqLiteDB.statisticQuery, same rows in the same order
+        rows = np.flatnonzero(mask)
+        if name == "departuresPerHour":
+            hours = (self.columns["departureTime"][rows].astype(np.int64) % 10080)//60
+            keys,counts = np.unique(self.columns["origin"][rows].astype(np.int64)*168+hours,return_counts=True)
+            airports = self.dictionaries["airports"]
+            data = [(airports[key//168],key % 168,count) for key,count in zip(keys.tolist(),counts.tolist())]
+            return sorted(data)
+        if name == "aircraftMix":
+            keys,counts = np.unique(self.columns["airline"][rows].astype(np.int64)*65536+self.columns["aircraft"][rows],return_counts=True)
+            airlines = self.dictionaries["airlines"]
+            aircraft = self.dictionaries["aircraft"]
+            mix = {}
+            for key,count in zip(keys.tolist(),counts.tolist()):
+                group = (airlines[key//65536],aircraftClasses.get(aircraft[key % 65536]))
+                mix[group] = mix.get(group,0)+count
+            return sorted([(airline,aircraftClass,count) for (airline,aircraftClass),count in mix.items()],key=lambda row: (row[0],-1 if row[1] == None else row[1]))
+        if name == "busiestRoutes":
+            keys,counts = np.unique(self.columns["origin"][rows].astype(np.int64)*65536+self.columns["destination"][rows],return_counts=True)
+            airports = self.dictionaries["airports"]
+            data = [(airports[key//65536],airports[key % 65536],count) for key,count in zip(keys.tolist(),counts.tolist())]
+            data.sort(key=lambda row: (-row[2],row[0],row[1]))
+            return data[:int(arg)]
+        if name == "durationHistogram":
+            binWidth = int(arg)
+            keys,counts = np.unique((self.columns["duration"][rows].astype(np.int64)//binWidth)*binWidth,return_counts=True)
+            return list(zip(keys.tolist(),counts.tolist()))
+        raise ValueError("Unknown statistic "+name)
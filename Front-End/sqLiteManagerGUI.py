@@ -6,12 +6,67 @@ Created on Wed Dec 10 18:29:26 2014
 """
 import sqlite3
 import random
+import os
+import json
+from bisect import bisect_left, bisect_right
+from collections import deque
+from time import monotonic
 from datetime import datetime
+from geoIndex import boundingBox
+from storageBackend import DiskBackend
+
+####exclusive (low,high) year bounds for each era checkbox, high of None is open ended
+eraBounds = [(1949,1960),(1959,1970),(1969,1980),(1979,1990),(1989,2000),(2000,2007),(2006,None)]
+
+def routeKey(value,position):
+    ####NULL first like SQL ORDER BY, None can't be compared with str, position in the fetched order breaks ties
+    return (not value is None,"" if value is None else value,position)
+
+def enableWal(filePath):
+    ####persistent, run once by whatever writes the DB so readers never block on a load
+    con = sqlite3.connect(filePath)
+    mode = con.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    con.close()
+    return mode
+
+class RecentlySeen:
+
+    ####bounded history, the oldest key is forgotten once size is exceeded
+    def __init__(self,size=200):
+        self.size = size
+        self.order = deque()
+        self.members = set()
+
+    def add(self,key):
+        if key in self.members or self.size < 1:
+            return
+        self.order.append(key)
+        self.members.add(key)
+        if len(self.order) > self.size:
+            self.members.discard(self.order.popleft())
+
+    def clear(self):
+        self.order.clear()
+        self.members.clear()
+
+    def __contains__(self,key):
+        return key in self.members
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
 
 class sqLiteDB:
 
-    def __init__(self,filePath):
+    def __init__(self,filePath,readOnly=False,backend=None):
         self.filePath = filePath
+        self.readOnly = readOnly
+        if backend == None:
+            backend = DiskBackend(filePath,readOnly)
+        self.backend = backend
+        self.aircraftCachePath = os.path.splitext(filePath)[0]+".aircraft.json"
         self.desiredAircraft = []
         self.desiredOrigin = []
         self.desiredDest = []
@@ -20,10 +75,32 @@ class sqLiteDB:
         self.maxDuration = -1
         self.timeFromNow = -1
         self.desiredEras = [1,1,1,1,1,1,1]
-        ####DELETE TEMPORARY TABLES IF THEY EXIST###
-        cursor = self.dbOpen(self.filePath)
-        cursor.execute("DROP TABLE IF EXISTS tempRouteTable")
-        cursor.close()
+        ####geographic filters need buildGeoIndex to have been run on the DB
+        self.nearOrigin = None
+        self.nearDest = None
+        self.originCountry = []
+        self.destCountry = []
+        self.minDistance = -1
+        self.maxDistance = -1
+        self.airportLocations = {}
+        self.snapshot = None
+        self.snapshotStamp = None
+        ####set once a stale snapshot is dropped mid session, the GUI then stops live updates
+        self.snapshotDropped = False
+        self.incremental = None
+        self.statsCache = {}
+        self.routeCache = None
+        ####guard rails, -1 switches each one off
+        self.queryTimeout = 30
+        self.maxRows = 500000
+        self.sampleThreshold = 200000
+        self.truncated = False
+        self.columnStats = None
+        ####random flights avoid the last recentFlights.size flights and spread across sampleStrata
+        ####("registration", "airline", "route" or None for plain uniform legs)
+        self.recentFlights = RecentlySeen(200)
+        self.sampleStrata = "registration"
+        self.aircraftClasses = None
 
     def buildAirportQuery(self):
         query = ""
@@ -67,21 +144,28 @@ class sqLiteDB:
             query += airlineString+")) AND "
         return query
 
+    def currentTimeWindow(self):
+        if self.timeFromNow == -1:
+            return None
+        if self.timeFromNow < 5:
+            self.timeFromNow = 5
+        if self.timeFromNow > 120:
+            self.timeFromNow = 120
+        t = datetime.utcnow()
+        day = t.isoweekday()
+        hour = t.hour
+        minute = t.minute
+        time = int(minute+(hour*60)+((day-1)*24*60))
+        priorTime = time+self.timeFromNow
+        if priorTime > 10080:
+            priorTime -= 10080
+        return (time,priorTime)
+
     def buildCurrentTimeQuery(self):
         query = ""
-        if not self.timeFromNow == -1:
-            if self.timeFromNow < 5:
-                self.timeFromNow = 5
-            if self.timeFromNow > 120:
-                self.timeFromNow = 120
-            t = datetime.utcnow()
-            day = t.isoweekday()
-            hour = t.hour
-            minute = t.minute
-            time = int(minute+(hour*60)+((day-1)*24*60))
-            priorTime = time+self.timeFromNow
-            if priorTime > 10080:
-                priorTime -= 10080
+        window = self.currentTimeWindow()
+        if not window == None:
+            time,priorTime = window
             if priorTime > time:
                 currentString = "(departureTime > "+str(time)+" AND departureTime < "+str(priorTime)
             else:
@@ -95,30 +179,105 @@ class sqLiteDB:
             query = "("
             for index,value in enumerate(self.desiredEras):
                 if value == 1:
-                    if index == 0:
-                        query += "(year > 1949 and year < 1960) OR "
-                    if index == 1:
-                        query += "(year > 1959 and year < 1970) OR "
-                    if index == 2:
-                        query += "(year > 1969 and year < 1980) OR "
-                    if index == 3:
-                        query += "(year > 1979 and year < 1990) OR "
-                    if index == 4:
-                        query += "(year > 1989 and year < 2000) OR "
-                    if index == 5:
-                        query += "(year > 2000 and year < 2007) OR "
-                    if index == 6:
-                        query += "(year > 2006) OR "
+                    low,high = eraBounds[index]
+                    if high == None:
+                        query += "(year > "+str(low)+") OR "
+                    else:
+                        query += "(year > "+str(low)+" and year < "+str(high)+") OR "
             query = query[:-4]
             query += ") AND "
         return query
 
+    def geoFiltersActive(self):
+        return not (self.nearOrigin == None and self.nearDest == None and len(self.originCountry) == 0 and len(self.destCountry) == 0 and self.minDistance == -1)
+
+    def getAirportLocation(self,airport):
+        if not airport in self.airportLocations:
+            cursor = self.dbOpen(self.filePath)
+            self.airportLocations[airport] = cursor.execute("SELECT latitude,longitude FROM AirportGeo WHERE airportCode = ?",(airport,)).fetchone()
+            cursor.close()
+            self.dbClose()
+        return self.airportLocations[airport]
+
+    def buildNearQuery(self,column,near):
+        airport,km = near
+        location = self.getAirportLocation(airport)
+        if location == None:
+            return "0 AND "
+        minLat,maxLat,minLon,maxLon = boundingBox(location[0],location[1],km)
+        query = column+" IN (SELECT airportCode FROM AirportGeo WHERE id IN (SELECT id FROM AirportRtree WHERE "
+        query += "maxLat >= "+str(minLat)+" AND minLat <= "+str(maxLat)+" AND maxLon >= "+str(minLon)+" AND minLon <= "+str(maxLon)+")"
+        query += " AND greatCircle(latitude,longitude,"+str(location[0])+","+str(location[1])+") <= "+str(km)+") AND "
+        return query
+
+    def buildCountryQuery(self,column,countries):
+        query = column+" IN (SELECT airportCode FROM AirportGeo WHERE country IN ("
+        for country in countries:
+            query += "'"+country.replace("'","''")+"',"
+        return query[:-1]+")) AND "
+
+    def buildGeoQuery(self):
+        query = ""
+        if not self.nearOrigin == None:
+            query += self.buildNearQuery("origin",self.nearOrigin)
+        if not self.nearDest == None:
+            query += self.buildNearQuery("destination",self.nearDest)
+        if len(self.originCountry) > 0:
+            query += self.buildCountryQuery("origin",self.originCountry)
+        if len(self.destCountry) > 0:
+            query += self.buildCountryQuery("destination",self.destCountry)
+        if not self.minDistance == -1:
+            query += "legId IN (SELECT legId FROM LegDistance WHERE distance > "+str(self.minDistance)+" AND distance < "+str(self.maxDistance)+") AND "
+        return query
+
+    def buildWhereClause(self):
+        query = self.buildAirlineQuery()
+        query += self.buildAirportQuery()
+        query += self.buildDurationQuery()
+        query += self.buildAircraftQuery()
+        query += self.buildCurrentTimeQuery()
+        query += self.buildEraQuery()
+        query += self.buildGeoQuery()
+        if query == "":
+            return ""
+        return " WHERE "+query[:-5]
+
+    def snapshotUsable(self):
+        self.checkSnapshot()
+        ####the snapshot has no coordinates, geographic filters always go to SQL
+        return not self.snapshot == None and not self.geoFiltersActive()
+
+    def checkSnapshot(self):
+        if not self.snapshot == None and not self.fileStamp() == self.snapshotStamp:
+            ####the DB was written since the snapshot was checked, drop it if the schedule changed
+            self.snapshotStamp = self.fileStamp()
+            if not self.snapshotCurrent(self.snapshot):
+                self.snapshot = None
+                self.incremental = None
+                self.snapshotDropped = True
+        return not self.snapshot == None
+
+    def fileStamp(self):
+        ####with WAL a load only touches the -wal file until it is checkpointed
+        stamp = []
+        for path in (self.filePath,self.filePath+"-wal"):
+            stamp.append(os.path.getmtime(path) if os.path.isfile(path) else None)
+        return tuple(stamp)
+
+    def snapshotCurrent(self,snapshot):
+        from scheduleSnapshot import sourceFingerprint
+        cursor = self.dbOpen(self.filePath)
+        source = sourceFingerprint(cursor)
+        cursor.close()
+        self.dbClose()
+        return source == snapshot.source
+
     def getAirportDetails(self,airport):
         query = "SELECT * FROM Airport WHERE airportCode = '"+airport+"';"
         cursor = self.dbOpen(self.filePath)
         data = cursor.execute(query).fetchone()
         cursor.close()
-        self.con.close()
+        self.dbClose()
         return data
 
     def getAirlineFull(self,airline):
@@ -126,7 +285,7 @@ class sqLiteDB:
         cursor = self.dbOpen(self.filePath)
         data = cursor.execute(query).fetchone()[0]
         cursor.close()
-        self.con.close()
+        self.dbClose()
         return data
 
     def getAircraftDetails(self,aircraft):
@@ -134,27 +293,101 @@ class sqLiteDB:
         cursor = self.dbOpen(self.filePath)
         data = cursor.execute(query).fetchone()
         cursor.close()
-        self.con.close()
+        self.dbClose()
         return data
 
+    def loadSnapshot(self,snapshotPath):
+        ####numpy is only needed when a snapshot is used
+        from scheduleSnapshot import ScheduleSnapshot
+        snapshot = ScheduleSnapshot(snapshotPath)
+        self.incremental = None
+        ####like the aircraft cache a stale snapshot is ignored and queries go to SQL
+        self.snapshotStamp = self.fileStamp()
+        if not self.snapshotCurrent(snapshot):
+            self.snapshot = None
+            return False
+        self.snapshot = snapshot
+        return True
+
+    def enableIncremental(self):
+        from incrementalFilter import IncrementalFilter
+        self.incremental = IncrementalFilter(self.snapshot)
+
     def getTableDetails(self):
-        baseQuery = "SELECT DISTINCT airline,origin,destination,aircraft FROM Flight NATURAL JOIN Leg WHERE "
-        baseQuery += self.buildAirlineQuery()
-        baseQuery += self.buildAirportQuery()
-        baseQuery += self.buildDurationQuery()
-        baseQuery += self.buildAircraftQuery()
-        baseQuery += self.buildCurrentTimeQuery()
-        baseQuery += self.buildEraQuery()
-        if baseQuery.endswith("AND "):
-            baseQuery = baseQuery[:-5]+" ORDER BY airline,origin,destination,aircraft;"
-        else:
-            baseQuery = baseQuery[:-7]+" ORDER BY airline,origin,destination,aircraft;"
+        ####truncated only ever describes the last route table fetch
+        self.truncated = False
+        if self.snapshotUsable():
+            if not self.incremental == None:
+                return self.incremental.routes(self)
+            return self.snapshot.routes(self)
+        baseQuery = "SELECT DISTINCT airline,origin,destination,aircraft FROM Flight NATURAL JOIN Leg"+self.buildWhereClause()
+        baseQuery += " ORDER BY airline,origin,destination,aircraft"
+        if not self.maxRows == -1:
+            baseQuery += " LIMIT "+str(self.maxRows+1)
         cursor = self.dbOpen(self.filePath)
-        data = cursor.execute(baseQuery).fetchall()
+        data = cursor.execute(baseQuery+";").fetchall()
         cursor.close()
-        self.con.close()
+        self.dbClose()
+        self.truncated = not self.maxRows == -1 and len(data) > self.maxRows
+        if self.truncated:
+            data = data[:self.maxRows]
         return data
 
+    def getSortedRoutes(self,sortColumn):
+        ####full result is fetched once per filter state, each sort order once per column
+        state = (self.snapshotUsable(),self.filterState())
+        if self.routeCache == None or not self.routeCache[0] == state:
+            ####(state,rows in fetched order,sorted (keys,rows) per column,fetched position of each row)
+            self.routeCache = (state,self.getTableDetails(),{},{})
+        orders = self.routeCache[2]
+        if not sortColumn in orders:
+            rows = self.routeCache[1]
+            keys = [routeKey(row[sortColumn],position) for position,row in enumerate(rows)]
+            ####SQL and the snapshot already return column 0 order, other columns sort flat keys
+            if not sortColumn == 0:
+                keys.sort()
+                rows = [rows[key[2]] for key in keys]
+            orders[sortColumn] = (keys,rows)
+        return orders[sortColumn]
+
+    def routePosition(self,row):
+        positions = self.routeCache[3]
+        if len(positions) == 0:
+            for position,fetched in enumerate(self.routeCache[1]):
+                positions[fetched] = position
+        return positions.get(tuple(row),-1)
+
+    def getTablePage(self,sortColumn=0,descending=False,after=None,pageSize=200):
+        ####keyset paging, after is the last row of the previous page so a page costs a bisect and a slice
+        keys,rows = self.getSortedRoutes(sortColumn)
+        if descending:
+            end = len(rows) if after == None else bisect_left(keys,routeKey(after[sortColumn],self.routePosition(after)))
+            return rows[max(0,end-pageSize):end][::-1]
+        start = 0 if after == None else bisect_right(keys,routeKey(after[sortColumn],self.routePosition(after)))
+        return rows[start:start+pageSize]
+
+    def getBoardLegs(self):
+        ####every leg passing the filters except the current time one, the board keeps its own window
+        ####only the columns the board shows, (legId,airline,flightNumber,origin,destination,departureTime,aircraft,registration)
+        ####returns (legs,truncated), the route table's truncated flag is left alone
+        timeFromNow = self.timeFromNow
+        self.timeFromNow = -1
+        try:
+            baseQuery = "SELECT legId,airline,flightNumber,origin,destination,departureTime,aircraft,registration FROM Flight NATURAL JOIN Leg"+self.buildWhereClause()
+        finally:
+            self.timeFromNow = timeFromNow
+        ####no ORDER BY, a cap taken in departure order would empty the board after the first hours of the week
+        if not self.maxRows == -1:
+            baseQuery += " LIMIT "+str(self.maxRows+1)
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute(baseQuery+";").fetchall()
+        cursor.close()
+        self.dbClose()
+        truncated = not self.maxRows == -1 and len(data) > self.maxRows
+        if truncated:
+            data = data[:self.maxRows]
+        return (data,truncated)
+
     def getSpecificFlight(self, airline, origin, dest, aircraft):
         baseQuery = "SELECT DISTINCT flightId,legId FROM Flight NATURAL JOIN Leg WHERE origin = '"+origin+"' AND destination = '"+dest+"' AND aircraft = '"+aircraft+"' AND (flightId IN (SELECT flightId FROM Flight WHERE airline = '"+airline+"')) AND "
         baseQuery += self.buildCurrentTimeQuery()
@@ -171,7 +404,7 @@ class sqLiteDB:
         cursor.execute(mainQuery)
         data = cursor.fetchall()
         cursor.close()
-        self.con.close()
+        self.dbClose()
         if len(data) == 0:
             return []
         return [data,legID]
@@ -250,56 +483,299 @@ class sqLiteDB:
         mainQuery = "SELECT * FROM Flight NATURAL JOIN Leg WHERE flightId = ("+mainQuery+");"
         data = cursor.execute(mainQuery).fetchall()
         cursor.close()
-        self.con.close()
+        self.dbClose()
         if len(data) == 0:
             return []
         return data
 
     def getRandomFlight(self):
-        baseQuery = "SELECT * FROM Flight NATURAL JOIN Leg WHERE "
-        baseQuery += self.buildAirportQuery()
-        baseQuery += self.buildDurationQuery()
-        baseQuery += self.buildAircraftQuery()
-        baseQuery += self.buildAirlineQuery()
-        baseQuery += self.buildCurrentTimeQuery()
-        baseQuery += self.buildEraQuery()
-        if baseQuery.endswith("AND "):
-            baseQuery = baseQuery[:-5]
+        flights = self.getRandomFlights(1)
+        if len(flights) == 0:
+            return []
+        return flights[0]
+
+    def getRandomFlights(self,count):
+        ####one candidate pass for the whole batch, flights never repeat within it or against recentFlights
+        if self.snapshotUsable():
+            if not self.incremental == None:
+                chosen = self.incremental.sampleFlights(self,count)
+            else:
+                chosen = self.snapshot.sampleFlights(self,count)
         else:
-            baseQuery = baseQuery[:-7]
-        baseQuery = "SELECT DISTINCT legID,registration,flightID FROM ("+baseQuery+ ");"
+            baseQuery = "SELECT DISTINCT legID,registration,flightID,airline,origin,destination FROM Flight NATURAL JOIN Leg"+self.buildWhereClause()+";"
+            ####large candidate sets are streamed instead of pulled into memory
+            stream = not self.sampleThreshold == -1 and self.estimateCandidates() > self.sampleThreshold
+            cursor = self.dbOpen(self.filePath)
+            cursor.execute(baseQuery)
+            if stream:
+                chosen = self.reservoirSample(cursor,count)
+            else:
+                chosen = self.materializedSample(cursor.fetchall(),count)
+            cursor.close()
+            self.dbClose()
+        results = []
+        for legId,flightId in chosen:
+            self.recentFlights.add(flightId)
+            baseQuery = "SELECT * FROM Flight NATURAL JOIN Leg WHERE flightID = "+str(flightId)+";"
+            cursor = self.dbOpen(self.filePath)
+            data = cursor.execute(baseQuery).fetchall()
+            cursor.close()
+            self.dbClose()
+            if len(data) > 0:
+                results.append([data,legId])
+        return results
+
+    def stratumKey(self,row):
+        ####row is (legID,registration,flightID,airline,origin,destination)
+        if self.sampleStrata == "registration":
+            return row[1]
+        if self.sampleStrata == "airline":
+            return row[3]
+        if self.sampleStrata == "route":
+            return (row[4],row[5])
+        return row[0]
+
+    def drawStratified(self,rows,count,chosen,chosenFlights):
+        ####pick a stratum uniformly then a leg in it, without replacement
+        groups = {}
+        for row in rows:
+            if not row[2] in chosenFlights:
+                key = self.stratumKey(row)
+                if not key in groups:
+                    groups[key] = []
+                groups[key].append(row)
+        keys = list(groups.keys())
+        while len(chosen) < count and len(keys) > 0:
+            index = random.randrange(len(keys))
+            group = groups[keys[index]]
+            position = random.randrange(len(group))
+            row = group[position]
+            group[position] = group[-1]
+            group.pop()
+            if len(group) == 0:
+                keys[index] = keys[-1]
+                keys.pop()
+            if not row[2] in chosenFlights:
+                chosenFlights.add(row[2])
+                chosen.append((row[0],row[2]))
+
+    def materializedSample(self,data,count=1):
+        chosen = []
+        chosenFlights = set()
+        self.drawStratified([row for row in data if not row[2] in self.recentFlights],count,chosen,chosenFlights)
+        ####recently seen flights only come back once everything else is used up
+        if len(chosen) < count:
+            self.drawStratified(data,count,chosen,chosenFlights)
+        return chosen
+
+    def reservoirSample(self,cursor,count=1):
+        ####count reservoir slots per stratum, memory follows the number of strata not legs
+        ####a slot is [legs counted,rows,flightIDs in rows], one row per flight so a batch is never short
+        fresh = {}
+        seen = {}
+        while True:
+            chunk = cursor.fetchmany(10000)
+            if len(chunk) == 0:
+                break
+            for row in chunk:
+                reservoirs = seen if row[2] in self.recentFlights else fresh
+                key = None if self.sampleStrata == None else self.stratumKey(row)
+                slot = reservoirs.get(key)
+                if slot == None:
+                    reservoirs[key] = [1,[row],set([row[2]])]
+                elif not row[2] in slot[2]:
+                    slot[0] += 1
+                    if len(slot[1]) < count:
+                        slot[1].append(row)
+                        slot[2].add(row[2])
+                    else:
+                        position = random.randrange(slot[0])
+                        if position < count:
+                            slot[2].discard(slot[1][position][2])
+                            slot[1][position] = row
+                            slot[2].add(row[2])
+        chosen = []
+        chosenFlights = set()
+        self.drawStratified([row for slot in fresh.values() for row in slot[1]],count,chosen,chosenFlights)
+        if len(chosen) < count:
+            self.drawStratified([row for slot in seen.values() for row in slot[1]],count,chosen,chosenFlights)
+        return chosen
+
+    def loadColumnStats(self):
+        ####(table rows,average rows per value) for each leading index column, as left by ANALYZE
+        stats = {}
+        tableRows = {}
         cursor = self.dbOpen(self.filePath)
-        cursor.execute(baseQuery)
-        data = cursor.fetchall()
-        availFlights = []
-        for tuple in data:
-            listTuple = list(tuple)
-            availFlights.append(listTuple)
-        ###get all regs and pick one
-        regSet = set()
-        for row in availFlights:
-            regSet.add(row[1])
-        chosenReg = random.sample(regSet,1)[0]
-        chosenFlights = []
-        for row in availFlights:
-            if row[1] == chosenReg:
-                chosenFlights.append(row)
-        chosenFlight = random.choice(chosenFlights)
-        baseQuery = "SELECT * FROM Flight NATURAL JOIN Leg WHERE flightID = "+str(chosenFlight[2])+";"
-        cursor.execute(baseQuery)
-        data = cursor.fetchall()
+        try:
+            data = cursor.execute("SELECT tbl,idx,stat FROM sqlite_stat1").fetchall()
+        except sqlite3.OperationalError:
+            data = []
+        for table,index,stat in data:
+            numbers = [int(number) for number in stat.split() if number.isdigit()]
+            if len(numbers) == 0:
+                continue
+            tableRows[table] = numbers[0]
+            if index == None or len(numbers) < 2:
+                continue
+            info = cursor.execute("PRAGMA index_info(\""+index.replace('"','""')+"\")").fetchall()
+            if len(info) > 0 and not info[0][2] in stats:
+                stats[info[0][2]] = (numbers[0],numbers[1])
+        if not "Leg" in tableRows:
+            tableRows["Leg"] = cursor.execute("SELECT MAX(rowid) FROM Leg").fetchone()[0] or 0
         cursor.close()
-        self.con.close()
-        if len(data) == 0:
+        self.dbClose()
+        return (tableRows["Leg"],stats)
+
+    def estimateCandidates(self):
+        if self.columnStats == None:
+            self.columnStats = self.loadColumnStats()
+        legRows,stats = self.columnStats
+        estimate = float(legRows)
+        for column,values in (("airline",self.desiredAirline),("origin",self.desiredOrigin),("destination",self.desiredDest),("aircraft",self.desiredAircraft)):
+            if len(values) > 0 and not values[0] == "":
+                if column in stats:
+                    rows,perValue = stats[column]
+                    estimate *= min(1.0,float(perValue*len(values))/max(rows,1))
+                else:
+                    estimate *= min(1.0,0.1*len(values))
+        if not self.minDuration == -1:
+            estimate *= 0.25
+        if not self.currentTimeWindow() == None:
+            estimate *= self.timeFromNow/10080.0
+        if 0 in self.desiredEras:
+            estimate *= self.desiredEras.count(1)/7.0
+        if self.geoFiltersActive():
+            estimate *= 0.1
+        return estimate
+
+    def hasTable(self,table):
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",(table,)).fetchone()
+        cursor.close()
+        self.dbClose()
+        return not data == None
+
+    def getAdjacentLeg(self,legId,step):
+        ####rotations are weekly so the last leg is followed by the first
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute("SELECT registration,year,season,sequence FROM Rotation WHERE legId = ?",(legId,)).fetchone()
+        if data == None:
+            cursor.close()
+            self.dbClose()
+            return None
+        ####IS so a NULL year or season still matches its own rotation
+        key = data[:3]
+        sequence = data[3]
+        rotationQuery = "SELECT legId FROM Rotation WHERE registration = ? AND year IS ? AND season IS ?"
+        data = cursor.execute(rotationQuery+" AND sequence = ?",key+(sequence+step,)).fetchone()
+        if data == None:
+            if step > 0:
+                data = cursor.execute(rotationQuery+" AND sequence = 0",key).fetchone()
+            else:
+                data = cursor.execute(rotationQuery+" ORDER BY sequence DESC LIMIT 1",key).fetchone()
+        cursor.close()
+        self.dbClose()
+        return data[0]
+
+    def getNextLeg(self,legId):
+        return self.getAdjacentLeg(legId,1)
+
+    def getPreviousLeg(self,legId):
+        return self.getAdjacentLeg(legId,-1)
+
+    def getRotation(self,registration,year,season):
+        query = "SELECT * FROM Flight NATURAL JOIN Leg WHERE legId IN (SELECT legId FROM Rotation WHERE registration = ? AND year IS ? AND season IS ?)"
+        query += " ORDER BY (SELECT sequence FROM Rotation WHERE Rotation.legId = Leg.legId);"
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute(query,(registration,year,season)).fetchall()
+        cursor.close()
+        self.dbClose()
+        return data
+
+    def getRandomRotation(self):
+        result = self.getRandomFlight()
+        if len(result) == 0:
             return []
-        return [data,chosenFlight[0]]
+        chosenLeg = result[1]
+        for row in result[0]:
+            if row[6] == chosenLeg:
+                registration,year,season = row[-3],row[4],row[3]
+        rotation = self.getRotation(registration,year,season)
+        if len(rotation) == 0:
+            return result
+        ####fly the rotation onwards from the chosen leg
+        for index,row in enumerate(rotation):
+            if row[6] == chosenLeg:
+                rotation = rotation[index:]+rotation[:index]
+        return [rotation,chosenLeg]
+
+    def filterState(self):
+        return (tuple(self.desiredAirline),tuple(self.desiredOrigin),tuple(self.desiredDest),tuple(self.desiredAircraft),
+                self.minDuration,self.maxDuration,self.currentTimeWindow(),tuple(self.desiredEras),
+                self.nearOrigin,self.nearDest,tuple(self.originCountry),tuple(self.destCountry),self.minDistance,self.maxDistance)
+
+    def getStatistic(self,name,arg=None):
+        ####results are kept per filter state, the current time window is part of the state
+        key = (name,arg,self.snapshotUsable(),self.filterState())
+        if not key in self.statsCache:
+            if len(self.statsCache) > 64:
+                self.statsCache.clear()
+            if self.snapshotUsable():
+                if self.aircraftClasses == None:
+                    self.aircraftClasses = self.pullAircraft()[2]
+                data = self.snapshot.statistic(name,self.snapshot.filterMask(self),arg,self.aircraftClasses)
+            else:
+                ####built first, buildWhereClause can open its own connection for airport locations
+                query = self.statisticQuery(name,arg)
+                cursor = self.dbOpen(self.filePath)
+                data = cursor.execute(query).fetchall()
+                cursor.close()
+                self.dbClose()
+            self.statsCache[key] = data
+        return self.statsCache[key]
+
+    def statisticQuery(self,name,arg):
+        where = self.buildWhereClause()
+        if name == "departuresPerHour":
+            return "SELECT origin,(departureTime % 10080)/60 AS hour,COUNT(*) FROM Flight NATURAL JOIN Leg"+where+" GROUP BY origin,hour ORDER BY origin,hour;"
+        if name == "aircraftMix":
+            query = "SELECT airline,aircraftClass,COUNT(*) FROM (SELECT airline,aircraft FROM Flight NATURAL JOIN Leg"+where+")"
+            query += " LEFT JOIN (SELECT DISTINCT aircraft,aircraftClass FROM Aircraft) USING (aircraft)"
+            return query+" GROUP BY airline,aircraftClass ORDER BY airline,IFNULL(aircraftClass,-1);"
+        if name == "busiestRoutes":
+            query = "SELECT origin,destination,COUNT(*) AS departures FROM Flight NATURAL JOIN Leg"+where
+            return query+" GROUP BY origin,destination ORDER BY departures DESC,origin,destination LIMIT "+str(int(arg))+";"
+        if name == "durationHistogram":
+            return "SELECT (duration/"+str(int(arg))+")*"+str(int(arg))+" AS bin,COUNT(*) FROM Flight NATURAL JOIN Leg"+where+" GROUP BY bin ORDER BY bin;"
+        raise ValueError("Unknown statistic "+name)
+
+    def getDeparturesPerHour(self):
+        return self.getStatistic("departuresPerHour")
+
+    def getAircraftMix(self):
+        return self.getStatistic("aircraftMix")
+
+    def getBusiestRoutes(self,limit=20):
+        return self.getStatistic("busiestRoutes",limit)
+
+    def getDurationHistogram(self,binWidth=60):
+        return self.getStatistic("durationHistogram",binWidth)
 
     def dbOpen(self,filePath):
-        self.con = sqlite3.connect(filePath)
-        self.con.text_factory = str
+        self.con = self.backend.connect()
+        ####the backend's progress handler checks this, nothing is re-registered per query
+        self.con.deadline = None
+        if self.queryTimeout > 0:
+            self.con.deadline = monotonic()+self.queryTimeout
         return self.con.cursor()
 
     def pullAircraft(self):
+        ####catalogue cache written by prepareDatabase, ignored once the DB is newer than it
+        cachePath = self.aircraftCachePath
+        if not cachePath == None and os.path.isfile(cachePath) and os.path.getmtime(cachePath) >= os.path.getmtime(self.filePath):
+            with open(cachePath) as cacheFile:
+                cache = json.load(cacheFile)
+            return (cache["families"],cache["names"],cache["roles"])
         cursor = self.dbOpen(self.filePath)
         data = cursor.execute("SELECT DISTINCT aircraftFamily,aircraft,fullName,aircraftClass FROM Aircraft").fetchall()
         famDict = {}
@@ -313,9 +789,34 @@ class sqLiteDB:
             nameDict[tuple[1]] = tuple[2]
             roleDict[tuple[1]] = tuple[3]
         cursor.close()
-        self.con.close()
+        self.dbClose()
         return (famDict,nameDict,roleDict)
 
+    def pullAirlines(self):
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute("SELECT airline,airlineFullName FROM Airline").fetchall()
+        cursor.close()
+        self.dbClose()
+        return data
+
+    def pullAirports(self):
+        ####same positions printLeg uses, city fourth, name last
+        return [(code,row[3],row[-1]) for code,row in self.pullAirportTable().items()]
+
+    def pullAirportTable(self):
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute("SELECT airportCode,* FROM Airport").fetchall()
+        cursor.close()
+        self.dbClose()
+        return dict((row[0],row[1:]) for row in data)
+
+    def pullAircraftTable(self):
+        cursor = self.dbOpen(self.filePath)
+        data = cursor.execute("SELECT aircraft,* FROM Aircraft").fetchall()
+        cursor.close()
+        self.dbClose()
+        return dict((row[0],row[1:]) for row in data)
+
     def dbClose(self):
         #print("Connection closing")
-        self.con.close()
+        self.backend.release(self.con)
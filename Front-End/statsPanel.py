@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Statistics window for the current filters.
+
+The aggregations run on a QThread against a copy of the sqLiteDB so the main
+window stays responsive while they are computed.
+"""
+from PyQt5 import QtCore, QtWidgets
+from copy import copy as copy
+
+class StatsWorker(QtCore.QThread):
+
+    done = QtCore.pyqtSignal(dict)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self,db):
+        QtCore.QThread.__init__(self)
+        ####own copy so this thread never shares the GUI's connection
+        self.db = copy(db)
+
+    def run(self):
+        try:
+            results = {}
+            results["Departures per hour"] = (["Airport","Hour of week","Departures"],self.db.getDeparturesPerHour())
+            results["Aircraft mix"] = (["Airline","Aircraft class","Legs"],self.db.getAircraftMix())
+            results["Busiest routes"] = (["From","To","Departures"],self.db.getBusiestRoutes())
+            results["Durations"] = (["Block time from (min)","Legs"],self.db.getDurationHistogram())
+            self.done.emit(results)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class StatsPanel(QtWidgets.QDialog):
+
+    def __init__(self,parent=None):
+        QtWidgets.QDialog.__init__(self,parent)
+        self.setWindowTitle("Schedule statistics")
+        self.resize(500,600)
+        self.verticalLayout = QtWidgets.QVBoxLayout(self)
+        self.statusLabel = QtWidgets.QLabel(self)
+        self.verticalLayout.addWidget(self.statusLabel)
+        self.tabs = QtWidgets.QTabWidget(self)
+        self.verticalLayout.addWidget(self.tabs)
+        self.worker = None
+
+    def refresh(self,db):
+        if not self.worker == None and self.worker.isRunning():
+            return
+        self.statusLabel.setText("Calculating....")
+        self.worker = StatsWorker(db)
+        self.worker.done.connect(self.showResults)
+        self.worker.failed.connect(self.statusLabel.setText)
+        self.worker.start()
+
+    def showResults(self,results):
+        self.tabs.clear()
+        for title,(headers,rows) in results.items():
+            table = QtWidgets.QTableWidget(len(rows),len(headers),self)
+            table.setHorizontalHeaderLabels(headers)
+            table.verticalHeader().setVisible(False)
+            table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+            for i,row in enumerate(rows):
+                for j,value in enumerate(row):
+                    table.setItem(i,j,QtWidgets.QTableWidgetItem(str(value)))
+            table.horizontalHeader().setStretchLastSection(True)
+            self.tabs.addTab(table,title)
+        self.statusLabel.setText("")
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends for sqLiteDB.
+
+A backend hands sqLiteDB a connection for each operation and takes it back
+afterwards. DiskBackend opens the schedule file every time, MemoryBackend copies
+it into a shared cache in-memory database at startup with the SQLite backup API,
+adds the indexes the filter queries use and gives each thread its own connection
+to it.
+
+Run as a script to compare them: python storageBackend.py FlightDB.db [runs]
+"""
+import os
+import sqlite3
+import threading
+from time import monotonic
+from geoIndex import greatCircle
+
+####(index,table,column) used by the filter, sample and lookup queries
+scheduleIndexes = [("LegFlightId","Leg","flightId"),
+                   ("LegOrigin","Leg","origin"),
+                   ("LegDestination","Leg","destination"),
+                   ("LegAircraft","Leg","aircraft"),
+                   ("LegDepartureTime","Leg","departureTime"),
+                   ("LegDuration","Leg","duration"),
+                   ("LegRegistration","Leg","registration"),
+                   ("FlightAirline","Flight","airline"),
+                   ("AirportCode","Airport","airportCode"),
+                   ("AirlineCode","Airline","airline"),
+                   ("AircraftCode","Aircraft","aircraft")]
+
+def createIndexes(con):
+    for index,table,column in scheduleIndexes:
+        con.execute("CREATE INDEX IF NOT EXISTS "+index+" ON "+table+" ("+column+")")
+    ####sqlite_stat1 feeds the planner and sqLiteDB.estimateCandidates
+    con.execute("ANALYZE")
+    con.commit()
+
+class ScheduleConnection(sqlite3.Connection):
+
+    ####set per query by sqLiteDB.dbOpen, None runs without a budget
+    deadline = None
+
+    def __init__(self,*args,**kwargs):
+        sqlite3.Connection.__init__(self,*args,**kwargs)
+        ####registered once per connection, create_function fails while a statement is running
+        self.text_factory = str
+        self.create_function("greatCircle",4,greatCircle)
+        self.set_progress_handler(self.expired,10000)
+
+    def expired(self):
+        ####aborts the running statement with OperationalError "interrupted"
+        return not self.deadline == None and monotonic() > self.deadline
+
+class DiskBackend:
+
+    def __init__(self,filePath,readOnly=False):
+        self.filePath = filePath
+        self.readOnly = readOnly
+
+    def connect(self):
+        if self.readOnly:
+            ####read only connections never take a write lock, with WAL they run alongside a load
+            path = os.path.abspath(self.filePath).replace("\\","/").replace("%","%25").replace("?","%3f").replace("#","%23")
+            return sqlite3.connect("file:///"+path.lstrip("/")+"?mode=ro",uri=True,timeout=30,factory=ScheduleConnection)
+        return sqlite3.connect(self.filePath,timeout=30,factory=ScheduleConnection)
+
+    def release(self,con):
+        con.close()
+
+class MemoryBackend:
+
+    def __init__(self,filePath):
+        self.filePath = filePath
+        self.uri = "file:schedule"+str(id(self))+"?mode=memory&cache=shared"
+        source = DiskBackend(filePath,readOnly=True).connect()
+        ####holds the shared cache open, the database is dropped with its last connection
+        self.keeper = sqlite3.connect(self.uri,uri=True)
+        source.backup(self.keeper)
+        source.close()
+        createIndexes(self.keeper)
+        self.local = threading.local()
+
+    def connect(self):
+        ####one connection per thread so a worker never runs on the GUI's connection
+        con = getattr(self.local,"con",None)
+        if con == None:
+            con = sqlite3.connect(self.uri,uri=True,factory=ScheduleConnection)
+            self.local.con = con
+        return con
+
+    def release(self,con):
+        pass
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from sqLiteManagerGUI import sqLiteDB
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    start = time.time()
+    memory = MemoryBackend(sys.argv[1])
+    print("Memory copy: %.2fs" % (time.time()-start))
+    for name,backend in (("disk",DiskBackend(sys.argv[1],readOnly=True)),("memory",memory)):
+        db = sqLiteDB(sys.argv[1],backend=backend)
+        airports = [code for code,city,airport in db.pullAirports()][:50]
+        timings = []
+        for label,operation in (("route table",db.getTableDetails),
+                                ("random flight",db.getRandomFlight),
+                                ("airport lookups",lambda: [db.getAirportDetails(code) for code in airports])):
+            start = time.time()
+            for run in range(runs):
+                operation()
+            timings.append("%s %.1fms" % (label,(time.time()-start)*1000/runs))
+        print(name+": "+", ".join(timings))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Stress check for concurrent readers during a schedule load.
+
+Copies the schedule into a scratch WAL database, then one writer process
+commits batches of Leg rows in a loop while reader processes query it through
+sqLiteDB(path,readOnly=True). Any OperationalError (database is locked, busy)
+seen by a reader fails the run.
+
+python walStress.py FlightDB.db [readers] [seconds]
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+from multiprocessing import Process, Queue
+from time import monotonic
+from sqLiteManagerGUI import sqLiteDB, enableWal
+
+def writer(filePath,seconds,results):
+    con = sqlite3.connect(filePath,timeout=30)
+    columns = [row[1] for row in con.execute("PRAGMA table_info(Leg)") if not row[1] == "legId"]
+    copyQuery = "INSERT INTO Leg ("+",".join(columns)+") SELECT "+",".join(columns)+" FROM Leg LIMIT 500"
+    commits = 0
+    end = monotonic()+seconds
+    while monotonic() < end:
+        ####a load in miniature, add a batch then take it out again so the DB stays the same size
+        top = con.execute("SELECT max(legId) FROM Leg").fetchone()[0]
+        con.execute(copyQuery)
+        con.commit()
+        con.execute("DELETE FROM Leg WHERE legId > ?",(top,))
+        con.commit()
+        commits += 2
+    con.close()
+    results.put(("writer",commits,[]))
+
+def reader(filePath,seconds,results):
+    db = sqLiteDB(filePath,readOnly=True)
+    queries = 0
+    errors = []
+    end = monotonic()+seconds
+    while monotonic() < end:
+        for operation in (db.getTableDetails,db.getRandomFlight):
+            try:
+                operation()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            queries += 1
+    results.put(("reader",queries,errors))
+
+def stressTest(sourcePath,readers=8,seconds=5.0):
+    scratchDir = tempfile.mkdtemp()
+    filePath = os.path.join(scratchDir,os.path.basename(sourcePath))
+    try:
+        source = sqlite3.connect(sourcePath)
+        target = sqlite3.connect(filePath)
+        source.backup(target)
+        source.close()
+        target.close()
+        enableWal(filePath)
+        results = Queue()
+        processes = [Process(target=writer,args=(filePath,seconds,results))]
+        processes += [Process(target=reader,args=(filePath,seconds,results)) for i in range(readers)]
+        for process in processes:
+            process.start()
+        ####drain before joining, a child blocks on exit until its queue item is taken
+        outcomes = [results.get() for process in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(scratchDir,ignore_errors=True)
+    commits = sum(count for role,count,errors in outcomes if role == "writer")
+    queries = sum(count for role,count,errors in outcomes if role == "reader")
+    errors = [error for role,count,errorList in outcomes for error in errorList]
+    return commits,queries,errors
+
+if __name__ == '__main__':
+    import sys
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    commits,queries,errors = stressTest(sys.argv[1],readers,seconds)
+    print("writer commits: "+str(commits)+", reader queries: "+str(queries)+", errors: "+str(len(errors)))
+    for error in sorted(set(errors)):
+        print("  "+error)
+    assert len(errors) == 0, "readers hit lock errors"